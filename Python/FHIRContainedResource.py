@@ -3,6 +3,8 @@
 #
 #  Class to hold contained resources until they are resolved.
 
+import fhirelementfactory
+
 
 class FHIRContainedResource(object):
     """ Class to hold contained resources until they are resolved.
@@ -14,13 +16,30 @@ class FHIRContainedResource(object):
     http://hl7.org/implement/standards/fhir/references.html#contained
     """
     
+    __slots__ = ('id', 'type', 'json', '_resource')
+    
     def __init__(self, jsondict=None):
         self.id = None
         self.type = None
         self.json = None
+        self._resource = None
         
         if jsondict is not None:
             self.id = jsondict.get('id')
             self.type = jsondict.get('resourceType')
             self.json = jsondict
     
+    @property
+    def resource(self):
+        """ The resource as an instance of the class its "resourceType" names,
+        created on first access; `None` for unknown resource types.
+        """
+        if self._resource is None and self.json is not None:
+            self._resource = fhirelementfactory.instantiate(self.json)
+        return self._resource
+    
+    def as_json(self):
+        """ The contained resource's JSON dictionary, as it was received.
+        """
+        return self.json
+    
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  Use servers and models from asyncio code; needs Python 3.7 or later.
+#  The models themselves don't import this module.
+
+import asyncio
+import logging
+import weakref
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import fhirbundle
+import fhirreference
+
+
+def run(func, *args, **kwargs):
+    """ Runs the function in the event loop's default executor, to keep JSON
+    decoding and model construction off the event loop.
+    
+    :returns: An awaitable for the function's result
+    """
+    return asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+class AsyncServer(object):
+    """ Adapts a server with the blocking protocol, like `FHIRServer`, to the
+    async protocol of `read_async()`, `perform_async()` and
+    `resolve_async()`: coroutines `request_json_async()` and
+    `post_json_async()`, taking the same arguments as their blocking
+    counterparts.
+    
+    Requests run on a thread pool, which also decodes the responses; at most
+    `concurrency` at a time, the others wait without taking a thread, so
+    thousands can be awaited at once. The blocking methods are passed
+    through, instances read with this server can still resolve references
+    synchronously.
+    """
+    
+    def __init__(self, server, concurrency=None):
+        self.server = server
+        """ The server with the blocking protocol. """
+        
+        self.concurrency = concurrency or getattr(server, 'max_connections', None) or 32
+        """ How many requests run at the same time, per event loop. """
+        
+        self.base_uri = getattr(server, 'base_uri', None)
+        self._executor = ThreadPoolExecutor(self.concurrency)
+        self._semaphores = weakref.WeakKeyDictionary()
+    
+    def __repr__(self):
+        return '<AsyncServer {}>'.format(self.server)
+    
+    async def request_json_async(self, path):
+        return await self._run(self.server.request_json, path)
+    
+    async def post_json_async(self, path, jsondict):
+        return await self._run(self.server.post_json, path, jsondict)
+    
+    def request_json(self, path):
+        return self.server.request_json(path)
+    
+    def post_json(self, path, jsondict):
+        return self.server.post_json(path, jsondict)
+    
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:                       # a semaphore can only be used by one loop
+            semaphore = asyncio.Semaphore(self.concurrency)
+            self._semaphores[loop] = semaphore
+        async with semaphore:
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+    
+    def close(self):
+        """ Shuts down the thread pool.
+        """
+        self._executor.shutdown(wait=False)
+
+
+async def read_async(cls, rem_id, server):
+    """ Like `cls.read()`, but with the async server protocol; the instance
+    is created off the event loop.
+    
+    :param cls: The resource class to instantiate
+    :param str rem_id: The id of the resource on the remote server
+    :param server: An instance of an async FHIR server or compatible class
+    :returns: An instance of `cls`
+    """
+    if not rem_id:
+        raise Exception("Cannot read resource without remote id")
+    
+    path = '{}/{}'.format(cls.resource_name, rem_id)
+    instance = await read_from_async(cls, path, server)
+    instance._remote_id = rem_id
+    
+    return instance
+
+
+async def read_from_async(cls, path, server):
+    """ Like `cls.read_from()`, but with the async server protocol.
+    
+    :param cls: The resource class to instantiate
+    :param str path: The REST path to read from
+    :param server: An instance of an async FHIR server or compatible class
+    :returns: An instance of `cls`
+    """
+    if not path:
+        raise Exception("Cannot read resource without REST path")
+    if server is None:
+        raise Exception("Cannot read resource without server instance")
+    
+    ret = await server.request_json_async(path)
+    instance = await run(cls, jsondict=ret)
+    instance._server = server
+    
+    return instance
+
+
+async def perform_async(search, server):
+    """ Like `search.perform()`, but with the async server protocol; the
+    instances are created off the event loop.
+    
+    :param search: A `FHIRSearch`, or a `FHIRSearchElement` as returned by
+        `where()`
+    :returns: A list of instances created from returned data, each of the
+        class named by its "resourceType"
+    """
+    if hasattr(search, 'as_search'):
+        search = search.as_search()
+    if server is None:
+        raise Exception("Need a server to perform search")
+    if search.resource_type is None:
+        raise Exception("Need resource_type set to perform search")
+    
+    res = await server.request_json_async(search.construct())
+    return await run(lambda: list(fhirbundle.instantiate(res.get('entry', []), search.resource_type)))
+
+
+async def resolve_async(reference, server=None):
+    """ Like `reference.resolved`, but fetches remote resources with the
+    async server protocol, whatever `FHIRReference.fetch_remote` says, and
+    instantiates them off the event loop.
+    
+    :param reference: The `FHIRReference` to resolve
+    :param server: The async server to fetch from; the server the root
+        resource came from if `None`
+    :returns: An instance of the resolved reference if dereferencing was
+        successful, `None` otherwise
+    """
+    refid, root, instance = reference._resolve_locally()
+    if instance is not None or refid is None:
+        return instance
+    
+    server = server or getattr(root, '_server', None)
+    path = fhirreference.remote_path(reference.reference, server) if server is not None else None
+    if path is None:
+        instance = fhirreference._cached_url(reference.reference, reference._referenced_class)
+        if instance is not None:
+            root.didResolveReference(refid, instance)
+        return instance
+    if not hasattr(server, 'request_json_async'):
+        raise Exception("Cannot resolve asynchronously with {}, which has no `request_json_async()`".format(server))
+    
+    klass = reference._referenced_class
+    instance = fhirreference._cached(server, path, klass)
+    if instance is None:
+        try:
+            jsondict = await server.request_json_async(path)
+        except Exception as e:
+            logging.warning("Failed to resolve \"{}\": {}".format(reference.reference, e))
+            return None
+        instance = await run(fhirreference._instantiate, jsondict, klass, server, path)
+    root.didResolveReference(refid, instance)
+    return instance
+
+
+async def resolve_all_async(resources, server, batch_size=50, batch=False):
+    """ Like `fhirreference.resolve_all()`, but with the async server
+    protocol: all requests are awaited at once, the server limits how many
+    run at the same time. Collecting the references and instantiating the
+    fetched resources runs off the event loop.
+    
+    :returns: A dict mapping the REST paths of the references to the
+        resolved instances, `None` for those the server did not return
+    """
+    if server is None:
+        raise Exception("Cannot resolve references without server instance")
+    
+    pending, resolved = await run(fhirreference._pending_references, resources, server)
+    paths = sorted(pending.keys())
+    found = {}
+    if batch:
+        bundles = fhirreference._batch_bundles(paths, batch_size)
+        responses = await asyncio.gather(*[server.post_json_async('', bundle) for chunk, bundle in bundles], return_exceptions=True)
+        for (chunk, bundle), response in zip(bundles, responses):
+            if isinstance(response, Exception):
+                logging.warning("Failed to read {} resources in a batch: {}".format(len(chunk), response))
+                continue
+            fhirreference._add_batch_response(found, chunk, response)
+    else:
+        requests = fhirreference._search_requests(paths, batch_size)
+        responses = await asyncio.gather(*[server.request_json_async(request[0]) for request in requests], return_exceptions=True)
+        for request, response in zip(requests, responses):
+            if isinstance(response, Exception):
+                logging.warning("Failed to request \"{}\": {}".format(request[0], response))
+                continue
+            fhirreference._add_search_response(found, request, response)
+    
+    await run(fhirreference._populate, pending, found, server, resolved)
+    return resolved
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  Load bulk exports, one resource per line (NDJSON), in parallel.
+
+import os
+import json
+import collections
+from concurrent.futures import ProcessPoolExecutor
+
+import fhirelementfactory
+
+
+def load(paths, jobs=None, batch_size=4194304, errors=None, func=None):
+    """ Reads NDJSON files and yields one instance per line, of the class
+    named by the line's "resourceType", in the order of the files and lines.
+    
+    The files are split into batches of about `batch_size` bytes, ending on
+    line boundaries, which worker processes parse. Only a few batches per
+    worker are in flight at any time, so memory does not depend on the size
+    of the files.
+    
+    Sending instances back from the workers costs about as much as parsing
+    them; pass `func` to do the per-resource work in the workers and only
+    send back its results.
+    
+    :param paths: A path or a list of paths to NDJSON files
+    :param int jobs: The number of worker processes; all CPUs if `None`, no
+        worker processes at all if 1
+    :param int batch_size: Approximate number of bytes per batch
+    :param list errors: If given, lines that can't be parsed are skipped and
+        `(path, byte offset, message)` tuples appended to it; otherwise the
+        first such line raises an exception
+    :param func: A module-level function called with each instance in the
+        worker processes; its results are yielded instead of the instances
+    :returns: A generator of model instances, or of `func`'s results
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    batches = [(path, start, end, errors is not None, func) for path in paths for start, end in batch_ranges(path, batch_size)]
+    jobs = jobs or os.cpu_count() or 1
+    
+    if jobs < 2:
+        for batch in batches:
+            instances, errs = load_batch(*batch)
+            if errs:
+                errors.extend(errs)
+            for instance in instances:
+                yield instance
+        return
+    
+    with ProcessPoolExecutor(jobs) as pool:
+        pending = collections.deque()
+        batches = iter(batches)
+        while True:
+            while len(pending) < 2 * jobs:
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                pending.append(pool.submit(load_batch, *batch))
+            if 0 == len(pending):
+                break
+            
+            instances, errs = pending.popleft().result()
+            if errs:
+                errors.extend(errs)
+            for instance in instances:
+                yield instance
+
+
+def batch_ranges(path, batch_size):
+    """ Splits the file into byte ranges of about `batch_size` bytes, each
+    ending after a newline or at the end of the file.
+    
+    :returns: A list of `(start, end)` tuples
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, 'rb') as handle:
+        start = 0
+        while start < size:
+            end = start + max(1, batch_size)
+            if end < size:
+                handle.seek(end - 1)
+                handle.readline()
+                end = handle.tell()
+            ranges.append((start, min(end, size)))
+            start = end
+    return ranges
+
+
+def load_batch(path, start, end, collect_errors=False, func=None):
+    """ Parses the lines in the given byte range of an NDJSON file; runs in
+    the worker processes.
+    
+    :returns: A tuple with a list of instances, or of `func`'s results, and a
+        list of errors
+    """
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        data = handle.read(end - start)
+    
+    instances = []
+    errors = []
+    offset = start
+    for line in data.split(b'\n'):
+        line_offset = offset
+        offset += len(line) + 1
+        if not line.strip():
+            continue
+        try:
+            js = json.loads(line.decode('utf-8'))
+            instance = fhirelementfactory.instantiate(js)
+            if instance is None:
+                raise Exception("No class for resource type \"{}\"".format(js.get('resourceType')))
+            instances.append(func(instance) if func is not None else instance)
+        except Exception as e:
+            if not collect_errors:
+                raise Exception("Failed to load the resource at byte {} of {}: {}".format(line_offset, path, e))
+            errors.append((path, line_offset, str(e)))
+    
+    return instances, errors
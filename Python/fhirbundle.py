@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  Read Bundles incrementally, one entry at a time.
+
+import re
+import json
+import codecs
+import logging
+
+import fhirelementfactory
+
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+
+def instantiate(entries, default=None):
+    """ Creates one model instance per entry's "content", of the class its
+    "resourceType" names.
+    
+    :param entries: An iterable of Bundle entry dictionaries
+    :param default: The class to use for content without a known resource type
+    :returns: A generator of model instances
+    """
+    for entry in entries:
+        content = entry.get('content')
+        if content is None:
+            continue
+        instance = fhirelementfactory.instantiate(content, default)
+        if instance is None:
+            logging.warning("No class for resource type \"{}\", skipping entry".format(content.get('resourceType')))
+            continue
+        yield instance
+
+
+def read_file(path, default=None):
+    """ Reads the Bundle in the given JSON file incrementally.
+    
+    :param str path: The path to the Bundle's JSON file
+    :param default: The class to use for content without a known resource type
+    :returns: A generator of model instances, one per entry
+    """
+    with open(path, 'rb') as handle:
+        for instance in BundleReader(handle).resources(default):
+            yield instance
+
+
+class BundleReader(object):
+    """ Reads a Bundle from a file-like object, like an open file or a HTTP
+    response, without holding more than one entry in memory.
+    
+    Iterating yields the dictionaries of the "entry" array as soon as they
+    have been read; the Bundle's other properties are collected in `bundle`.
+    A small tokenizer walks the Bundle's top level and the "entry" array, the
+    values themselves are decoded by the `json` module.
+    """
+    
+    def __init__(self, stream, chunk_size=65536):
+        self.stream = stream
+        """ File-like object returning bytes (UTF-8) or text from `read()`. """
+        
+        self.chunk_size = chunk_size
+        
+        self.bundle = {}
+        """ The Bundle's properties other than "entry", filled while reading. """
+        
+        self._buffer = ''
+        self._pos = 0
+        self._offset = 0            # characters dropped from the buffer, for error messages
+        self._eof = False
+        self._utf8 = None
+    
+    def __iter__(self):
+        """ Yields the Bundle's entries, one dictionary at a time.
+        """
+        self._expect('{')
+        if '}' == self._peek():
+            self._pos += 1
+            return
+        
+        while True:
+            key = self._value()
+            if not isinstance(key, type(u'')):
+                raise ValueError("Expected a property name at character {} but found {}".format(self._offset + self._pos, key))
+            self._expect(':')
+            if 'entry' == key:
+                self._expect('[')
+                if ']' == self._peek():
+                    self._pos += 1
+                else:
+                    while True:
+                        yield self._value()
+                        if ']' == self._expect(',]'):
+                            break
+            else:
+                self.bundle[key] = self._value()
+            if '}' == self._expect(',}'):
+                break
+    
+    def resources(self, default=None):
+        """ Yields one model instance per entry, see `instantiate()`.
+        """
+        return instantiate(self, default)
+    
+    
+    # MARK: Tokenizing
+    
+    def _read(self, size=None):
+        """ Appends the next chunk from the stream to the buffer, dropping
+        what has been consumed.
+        
+        :returns: False at the end of the stream
+        """
+        while not self._eof:
+            chunk = self.stream.read(size or self.chunk_size)
+            if not chunk:
+                self._eof = True
+            if isinstance(chunk, bytes):
+                if self._utf8 is None:
+                    self._utf8 = codecs.getincrementaldecoder('utf-8')()
+                chunk = self._utf8.decode(chunk, final=self._eof)
+            if chunk:
+                self._offset += self._pos
+                self._buffer = self._buffer[self._pos:] + chunk
+                self._pos = 0
+                return True
+        return False
+    
+    def _peek(self):
+        """ Skips whitespace and returns the next character, an empty string
+        at the end of the stream.
+        """
+        while True:
+            self._pos = _whitespace.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read():
+                return ''
+    
+    def _expect(self, chars):
+        """ Consumes the next character, which must be one of `chars`.
+        """
+        char = self._peek()
+        if '' == char or char not in chars:
+            raise ValueError("Expected one of \"{}\" at character {} but found \"{}\"".format(chars, self._offset + self._pos, char))
+        self._pos += 1
+        return char
+    
+    def _value(self):
+        """ Decodes the next JSON value, reading more of the stream until the
+        value is complete.
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._pos)
+                if end < len(self._buffer) or self._eof:        # a number at the end may continue in the next chunk
+                    self._pos = end
+                    return value
+            except ValueError:
+                if self._eof:
+                    raise
+            # grow geometrically so large values are not decoded over and over
+            self._read(max(self.chunk_size, len(self._buffer) - self._pos))
@@ -4,32 +4,116 @@
 #  Facilitate working with dates.
 #  2014, SMART Platforms.
 
+import re
 import sys
 import isodate
 import datetime
 
+try:
+    from functools import lru_cache
+except ImportError:                 # Python 2.x
+    lru_cache = None
+
+
+# FHIR's date, dateTime and instant, with partial dates like "2014" or "2014-05"
+_date_ptrn = re.compile(r'^(\d{4})(?:-(\d{2})(?:-(\d{2}))?)?$')
+_datetime_ptrn = re.compile(r'^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2})(?::(\d{2})(?:\.(\d{1,6}))?)?(Z|([+-])(\d{2}):(\d{2}))?$')
+_timezones = {}
+
+_parse_cache_size = 4096
+""" How many distinct date strings `parse()` remembers; change it with
+`set_parse_cache_size()`. """
+
+
+def _parse(jsonval):
+    """ Parses a FHIR date, dateTime or instant string, using isodate for
+    anything the precompiled patterns don't cover.
+    
+    :returns: A `datetime.datetime` if the string has a time, a
+        `datetime.date` otherwise
+    """
+    if 'T' not in jsonval:
+        match = _date_ptrn.match(jsonval)
+        if match is None:
+            return isodate.parse_date(jsonval)
+        year, month, day = match.groups()
+        return datetime.date(int(year), int(month or 1), int(day or 1))
+    
+    match = _datetime_ptrn.match(jsonval)
+    if match is None:
+        return isodate.parse_datetime(jsonval)
+    year, month, day, hour, minute, second, fraction, tzname, tzsign, tzhour, tzmin = match.groups()
+    tz = None
+    if tzname is not None:
+        tz = _timezones.get(tzname)
+        if tz is None:
+            tz = isodate.isotzinfo.build_tzinfo(tzname, tzsign, int(tzhour or 0), int(tzmin or 0))
+            _timezones[tzname] = tz
+    return datetime.datetime(int(year), int(month), int(day), int(hour), int(minute),
+        int(second or 0), int((fraction or '0').ljust(6, '0')), tz)
+
+
+def set_parse_cache_size(size):
+    """ Rebuilds `parse()` to remember up to `size` distinct date strings,
+    none if 0, forgetting those it remembered so far. Date and datetime
+    instances are immutable, so repeated strings can share them.
+    """
+    global parse, _parse_cache_size
+    _parse_cache_size = size
+    parse = lru_cache(maxsize=size)(_parse) if lru_cache is not None else _parse
+
+set_parse_cache_size(_parse_cache_size)
+
 
 class FHIRDate(object):
     """ Facilitate working with dates.
     
     - `date`: datetime object representing the receiver's date-time
+    - `origval`: the JSON string, kept in `deferred` mode until `date` is set
     """
     
+    __slots__ = ('_date', 'origval')
+    
+    deferred = False
+    """ Set to True to keep the JSON string and only parse `date` when it is
+    first read; `isostring` then returns the original string as is. """
+    
     def __init__(self, jsonval=None):
-        self.date = None
+        self._date = None
+        self.origval = None
         if jsonval is not None:
-            if 'T' in jsonval:
-                self.date = isodate.parse_datetime(jsonval)
+            if self.deferred:
+                self.origval = jsonval
             else:
-                self.date = isodate.parse_date(jsonval)
+                self._date = parse(jsonval)
+    
+    @property
+    def date(self):
+        if self._date is None and self.origval is not None:
+            self._date = parse(self.origval)
+        return self._date
+    
+    @date.setter
+    def date(self, value):
+        self._date = value
+        self.origval = None
     
     @property
     def isostring(self):
-        if self.date is None:
+        if self.origval is not None:
+            return self.origval
+        if self._date is None:
             return None
-        if isinstance(self.date, datetime.datetime):
-            return isodate.datetime_isoformat(self.date)
-        return isodate.date_isoformat(self.date)
+        if isinstance(self._date, datetime.datetime):
+            dt = self._date
+            return '%04d-%02d-%02dT%02d:%02d:%02d%s' % (dt.year, dt.month, dt.day,
+                dt.hour, dt.minute, dt.second, isodate.tz_isoformat(dt))
+        return self._date.isoformat()
+    
+    def as_json(self):
+        """ The ISO string of the date, for JSON serialization.
+        """
+        return self.isostring
     
     @classmethod
     def with_json(cls, jsonobj):
@@ -5,11 +5,23 @@
 
 import logging
 
+import fhirintern
+
 
 class FHIRElement(object):
     """ Base class for all FHIR elements.
     """
     
+    __slots__ = ('extension', 'modifierExtension', 'contained', '_resolved', '_owner', '_root', '_unknown_keys', '_json')
+    
+    lazy = False
+    """ Set to True, here or on a subclass, to keep the JSON dictionary and
+    only convert properties when they are first accessed. """
+    
+    flyweight = False
+    """ Set by `fhirintern.enable()` on classes whose instances are shared
+    between all places with equal JSON. """
+    
     def __init__(self, jsondict=None):
         self.extension = None
         self.modifierExtension = None
@@ -21,30 +33,139 @@ class FHIRElement(object):
         self._owner = None
         """ Points to the parent resource, if there is one. """
         
+        self._root = None
+        """ The topmost owner, cached by `root`. """
+        
+        self._unknown_keys = None
+        """ Keys of the JSON dictionary that the receiver has no property for. """
+        
+        self._json = None
+        """ The JSON dictionary properties are converted from in lazy mode. """
+        
         if jsondict is not None:
             self.update_with_json(jsondict)
     
     def update_with_json(self, jsondict):
-        """ Update the receiver with data in a JSON dictionary.
+        """ Update the receiver with data in a JSON dictionary. Only the keys
+        present are looked up in `json_parsers()`; keys the receiver does not
+        know are collected in `_unknown_keys`. In `lazy` mode the properties
+        are only unset, `__getattr__()` converts them when accessed.
         """
         if jsondict is None:
             return
         
-        # extract extensions
-        if 'extension' in jsondict:
-            self.extension = extension.Extension.with_json(jsondict['extension'])
-        if 'modifierExtension' in jsondict:
-            self.modifierExtension = extension.Extension.with_json(jsondict['modifierExtension'])
-        
-        # extract contained resources
-        if 'contained' in jsondict:
-            self.contained = self.contained or {}
-            for js in jsondict['contained']:         # "contained" should be an array
-                res = fhircontainedresource.FHIRContainedResource(jsondict=js)
-                if res.id:
-                    self.contained[res.id] = res
+        parsers = self.__class__.json_parsers()
+        lazy = self.lazy
+        unknown = None
+        for key, value in jsondict.items():
+            parser = parsers.get(key)
+            if parser is not None:
+                if lazy:
+                    try:
+                        delattr(self, parser[0])
+                    except AttributeError:          # still unset from a previous update
+                        pass
+                else:                               # inlined `_value_from_json()`, this is the hot path
+                    name, klass, reference = parser
+                    if klass is None:
+                        setattr(self, name, value)
+                    elif reference is None:
+                        setattr(self, name, klass.with_json_and_owner(value, self))
+                    else:
+                        setattr(self, name, klass.with_json_and_owner(value, self, reference))
+            elif 'contained' == key:
+                self.update_contained(value)
+            elif 'resourceType' != key:
+                if unknown is None:
+                    unknown = [key]
                 else:
-                    logging.warning("Contained resource {} does not have an id, ignoring".format(res))
+                    unknown.append(key)
+        self._unknown_keys = unknown
+        if lazy:
+            self._json = dict(self._json, **jsondict) if self._json is not None else jsondict
+    
+    def _value_from_json(self, parser, value):
+        """ Converts a JSON value with a parser from `json_parsers()`.
+        """
+        name, klass, reference = parser
+        if klass is None:
+            return value
+        if reference is None:
+            return klass.with_json_and_owner(value, self)
+        return klass.with_json_and_owner(value, self, reference)
+    
+    def __getattr__(self, name):
+        """ Only called for unset attributes; in lazy mode these are the
+        properties still waiting in the JSON dictionary, which are converted
+        and cached now.
+        """
+        key = self.__class__.json_keys().get(name) if '_' != name[0] else None
+        jsondict = getattr(self, '_json', None) if key is not None else None
+        if jsondict is None or key not in jsondict:
+            raise AttributeError("'{}' object has no attribute '{}'".format(self.__class__.__name__, name))
+        
+        value = self._value_from_json(self.__class__.json_parsers()[key], jsondict[key])
+        setattr(self, name, value)
+        return value
+    
+    def update_contained(self, jsonarr):
+        """ Stores the contained resources in the JSON array by their id.
+        """
+        self.contained = self.contained or {}
+        for js in jsonarr:                          # "contained" should be an array
+            res = fhircontainedresource.FHIRContainedResource(jsondict=js)
+            if res.id:
+                self.contained[res.id] = res
+            else:
+                logging.warning("Contained resource {} does not have an id, ignoring".format(res))
+    
+    @classmethod
+    def json_parsers(cls):
+        """ The receiving class' table mapping JSON keys to parsers, built by
+        `_declared_json_parsers()` on first use and cached per class.
+        
+        :returns: A dict mapping keys to `(property name, class, referenced
+            class)` tuples; class is `None` for native values
+        """
+        parsers = cls.__dict__.get('_json_parsers')
+        if parsers is None:
+            parsers = cls._declared_json_parsers()
+            cls._json_parsers = parsers
+        return parsers
+    
+    @classmethod
+    def json_keys(cls):
+        """ The inverse of `json_parsers()`, mapping property names to JSON
+        keys; cached per class.
+        """
+        keys = cls.__dict__.get('_json_keys')
+        if keys is None:
+            keys = {parser[0]: key for key, parser in cls.json_parsers().items()}
+            cls._json_keys = keys
+        return keys
+    
+    @classmethod
+    def _declared_json_parsers(cls):
+        """ Subclasses add the parsers for their properties to the dictionary
+        returned by their superclass.
+        """
+        return {
+            'extension': ('extension', extension.Extension, None),
+            'modifierExtension': ('modifierExtension', extension.Extension, None),
+        }
+    
+    def as_json(self):
+        """ Serializes the receiver to a JSON dictionary; subclasses add their
+        properties to the dictionary returned by their superclass.
+        """
+        js = {}
+        if self.extension is not None:
+            js['extension'] = [item.as_json() for item in self.extension]
+        if self.modifierExtension is not None:
+            js['modifierExtension'] = [item.as_json() for item in self.modifierExtension]
+        if self.contained is not None:
+            js['contained'] = [res.as_json() for res in self.contained.values()]
+        return js
     
     @classmethod
     def with_json(cls, jsonobj):
@@ -71,6 +192,11 @@ class FHIRElement(object):
         :param FHIRElement owner: The owning parent
         :returns: An instance or a list of instances created from JSON data
         """
+        if cls.flyweight:
+            if list == type(jsonobj):
+                return [fhirintern.flyweight(cls, js, owner) for js in jsonobj]
+            return fhirintern.flyweight(cls, jsonobj, owner)
+        
         instance = cls.with_json(jsonobj)
         if list == type(instance):
             for inst in instance:
@@ -83,6 +209,19 @@ class FHIRElement(object):
     
     # MARK: Handling References
     
+    @property
+    def root(self):
+        """ The topmost owner, the resource the receiver is part of; the
+        receiver itself if it has no owner. Looked up once, then cached.
+        """
+        root = self._root
+        if root is None:
+            if self._owner is None:
+                return self
+            root = self._owner.root
+            self._root = root
+        return root
+    
     def containedReference(self, refid):
         """ Returns the contained reference with the given id, if it exists.
         """
@@ -92,23 +231,22 @@ class FHIRElement(object):
     
     def resolvedReference(self, refid):
         """ Returns the resolved reference with the given id, if it has been
-        resolved already.
+        resolved already. These are kept by the topmost owner, so all
+        references in a resource share one instance per id.
         """
-        if self._resolved and refid in self._resolved:
-            return self._resolved[refid]
-        return self._owner.resolvedReference(refid) if self._owner is not None else None
+        resolved = self.root._resolved
+        return resolved.get(refid) if resolved else None
     
     def didResolveReference(self, refid, resolved):
         """ Called by FHIRResource when it resolves a reference. Stores the
         resolved reference into the `_resolved` dictionary of the topmost
         owner.
         """
-        if self._owner is not None:
-            self._owner.didResolveReference(refid, resolved)
-        elif self._resolved is not None:
-            self._resolved[refid] = resolved
+        root = self.root
+        if root._resolved is not None:
+            root._resolved[refid] = resolved
         else:
-            self._resolved = {refid: resolved}
+            root._resolved = {refid: resolved}
     
 
 # these are subclasses of FHIRElement, import last
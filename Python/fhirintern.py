@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  Deduplicate repeated strings and codings while parsing.
+
+import sys
+
+try:
+    from sys import intern as intern_builtin
+except ImportError:                 # Python 2.x
+    from __builtin__ import intern as intern_builtin
+
+
+strings_enabled = False
+""" Whether the values of code, uri and id properties are interned. """
+
+flyweight_cache_size = 65536
+""" How many distinct flyweight instances are kept at most. """
+
+_flyweights = {}
+_stats = {
+    'strings_deduplicated': 0,
+    'string_bytes_saved': 0,
+    'flyweights': 0,
+    'flyweight_hits': 0,
+    'flyweight_bytes_saved': 0,
+}
+
+
+def enable(strings=True, flyweights=('Coding', 'CodeableConcept')):
+    """ Turns interning on for models parsed from now on.
+    
+    :param bool strings: Whether to intern code, uri and id values
+    :param flyweights: Names of classes whose instances are shared between
+        all places with equal JSON; these must be treated as immutable
+    """
+    import fhirelementfactory
+    global strings_enabled
+    strings_enabled = strings
+    _reset_parsers()
+    for name in flyweights or []:
+        klass = fhirelementfactory.resource_class(name)
+        if klass is None:
+            raise Exception("There is no class \"{}\" to use flyweights for".format(name))
+        klass.flyweight = True
+
+
+def disable():
+    """ Turns interning off and empties the flyweight cache.
+    """
+    import fhirelement
+    global strings_enabled
+    strings_enabled = False
+    _reset_parsers()
+    _flyweights.clear()
+    for klass in _subclasses(fhirelement.FHIRElement):
+        if 'flyweight' in klass.__dict__:
+            klass.flyweight = False
+
+
+def report():
+    """ How much interning has saved so far.
+    
+    :returns: A dict with counts and estimated bytes saved
+    """
+    stats = dict(_stats)
+    stats['bytes_saved'] = stats['string_bytes_saved'] + stats['flyweight_bytes_saved']
+    return stats
+
+
+def reset_report():
+    for key in _stats:
+        _stats[key] = 0
+
+
+def intern_string(value):
+    """ Returns the one shared copy of the given string.
+    """
+    interned = intern_builtin(value)
+    if interned is not value:
+        _stats['strings_deduplicated'] += 1
+        _stats['string_bytes_saved'] += sys.getsizeof(value)
+    return interned
+
+
+def string_class():
+    """ The class generated classes parse code, uri and id values with:
+    `InternedString` while strings are interned, otherwise `None` to take
+    them as they are without any call.
+    """
+    return InternedString if strings_enabled else None
+
+
+class InternedString(object):
+    """ Used by generated classes to parse code, uri and id values while
+    strings are interned.
+    """
+    
+    @classmethod
+    def with_json_and_owner(cls, jsonobj, owner):
+        if isinstance(jsonobj, list):
+            return [intern_string(value) if isinstance(value, str) else value for value in jsonobj]
+        return intern_string(jsonobj) if isinstance(jsonobj, str) else jsonobj
+
+
+def flyweight(cls, jsondict, owner):
+    """ Returns the shared instance of `cls` for the given JSON dictionary,
+    creating it if needed. Instances of JSON containing references are not
+    shared, since resolving needs their owner.
+    """
+    key = _freeze(jsondict)
+    if key is None:
+        instance = cls(jsondict)
+        instance._owner = owner
+        return instance
+    
+    key = (cls, key)
+    cached = _flyweights.get(key)
+    if cached is not None:
+        _stats['flyweight_hits'] += 1
+        _stats['flyweight_bytes_saved'] += cached[1]
+        return cached[0]
+    
+    instance = cls(jsondict)
+    if len(_flyweights) < flyweight_cache_size:
+        _flyweights[key] = (instance, _sizeof(instance, set()))
+        _stats['flyweights'] += 1
+    else:
+        instance._owner = owner
+    return instance
+
+
+def _freeze(value):
+    """ A hashable key equal for equal JSON, `None` if the JSON contains a
+    reference.
+    """
+    if isinstance(value, dict):
+        if 'reference' in value:
+            return None
+        items = []
+        for key, val in value.items():
+            frozen = _freeze(val)
+            if frozen is None:
+                return None
+            items.append((key, frozen))
+        items.sort()
+        return (dict, tuple(items))
+    if isinstance(value, list):
+        items = []
+        for val in value:
+            frozen = _freeze(val)
+            if frozen is None:
+                return None
+            items.append(frozen)
+        return (list, tuple(items))
+    return (value.__class__, value)         # keeps 1, 1.0 and True apart
+
+
+def _sizeof(obj, seen):
+    """ Estimates the memory taken by an instance and everything it holds,
+    except its owner, root and classes.
+    """
+    if obj is None or id(obj) in seen or isinstance(obj, (type, bool)):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (list, tuple)):
+        children = obj
+    elif isinstance(obj, dict):
+        children = list(obj.keys()) + list(obj.values())
+    elif hasattr(obj, '__dict__') or hasattr(obj.__class__, '__slots__'):
+        children = [val for key, val in getattr(obj, '__dict__', {}).items() if key not in ('_owner', '_root')]
+        for klass in obj.__class__.__mro__:
+            for name in klass.__dict__.get('__slots__', ()):
+                if name not in ('_owner', '_root', '_json'):
+                    children.append(getattr(obj, name, None))
+    else:
+        children = []
+    return size + sum(_sizeof(child, seen) for child in children)
+
+
+def _reset_parsers():
+    """ Makes all classes build their JSON parser tables again, picking up
+    `string_class()`.
+    """
+    import fhirelement
+    for klass in _subclasses(fhirelement.FHIRElement):
+        if '_json_parsers' in klass.__dict__:
+            del klass._json_parsers
+
+
+def _subclasses(klass):
+    for sub in klass.__subclasses__():
+        yield sub
+        for subsub in _subclasses(sub):
+            yield subsub
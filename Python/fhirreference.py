@@ -3,14 +3,32 @@
 #
 #  Subclassing FHIR's resource reference to add resolving capabilities
 
+import re
 import logging
+import collections
+
+import fhirelement
 import resourcereference
+import fhirelementfactory
+
+
+cache = None
+""" A shared cache of remote resources, like a
+`fhirreferencecache.ReferenceCache`; consulted before asking the server. """
+
+_remote_ptrn = re.compile(r'^(?:(?P<base>https?://.+)/)?(?P<type>[A-Za-z][A-Za-z0-9]*)/(?P<id>[A-Za-z0-9\-\.]{1,64})(?:/_history/(?P<version>[A-Za-z0-9\-\.]{1,64}))?/?$')
 
 
 class FHIRReference(resourcereference.ResourceReference):
     """ Subclassing FHIR's resource reference to add resolving capabilities.
     """
     
+    __slots__ = ('_referenced_class',)
+    
+    fetch_remote = False
+    """ Set to True to have `resolved` fetch remote resources it doesn't
+    find otherwise, one blocking request per reference. """
+    
     def __init__(self, jsondict=None):
         self._referenced_class = None
         """ The class/resource this reference is resolving to. """
@@ -45,11 +63,50 @@ class FHIRReference(resourcereference.ResourceReference):
     @property
     def resolved(self):
         """ Resolves the reference and caches the result, returning instance(s)
-        of the referenced classes.
+        of the referenced classes. The cache is kept by the root resource, so
+        each contained resource is instantiated once however many references
+        point to it.
+        
+        Remote resources are returned if `resolve_all()` fetched them or if
+        they are in the shared `cache`, which absolute references are looked
+        up in even if the root resource has no server; they are only fetched
+        from the server the root resource came from in `fetch_remote` mode.
         
         :returns: An instance (or list thereof) of the resolved reference if
             dereferencing was successful, `None` otherwise
         """
+        refid, root, instance = self._resolve_locally()
+        if instance is not None or refid is None:
+            return instance
+        
+        server = getattr(root, '_server', None)
+        path = remote_path(self.reference, server) if server is not None else None
+        if path is None:
+            instance = _cached_url(self.reference, self._referenced_class)
+            if instance is not None:
+                root.didResolveReference(refid, instance)
+            return instance
+        instance = _cached(server, path, self._referenced_class)
+        if instance is None:
+            if not self.fetch_remote:
+                return None
+            try:
+                jsondict = server.request_json(path)
+            except Exception as e:
+                logging.warning("Failed to resolve \"{}\": {}".format(self.reference, e))
+                return None
+            instance = _instantiate(jsondict, self._referenced_class, server, path)
+        root.didResolveReference(refid, instance)
+        return instance
+    
+    def _resolve_locally(self):
+        """ Looks for the referenced resource among the references the root
+        resource has resolved and among the contained resources.
+        
+        :returns: A tuple with the reference id, the root resource and the
+            instance, `None` if it must be fetched; all `None` if there is no
+            reference
+        """
         if self._owner is None:
             raise Exception("Cannot resolve reference without having an owner")
         if self._referenced_class is None:
@@ -58,31 +115,303 @@ class FHIRReference(resourcereference.ResourceReference):
         refid = self.processedReferenceIdentifier()
         if not refid:
             logging.warning("No `reference` set, cannot resolve")
-            return None
+            return None, None, None
         
-        resolved = self._owner.resolvedReference(refid)
+        root = self._owner.root
+        resolved = root._resolved.get(refid) if root._resolved else None
         if resolved is not None:
-            return resolved
+            return refid, root, resolved
         
         # not yet resolved, see if it's a contained resource
         contained = self._owner.containedReference(refid)
         if contained is not None:
-            instance = self._referenced_class(jsondict=contained.json)
-            self._owner.didResolveReference(refid, instance)
-            return instance
-        
-        # TODO: fetch remote resources
-        return None
+            instance = contained.resource
+            if not isinstance(instance, self._referenced_class):
+                instance = self._referenced_class(jsondict=contained.json)
+            root.didResolveReference(refid, instance)
+            return refid, root, instance
+        return refid, root, None
     
     def processedReferenceIdentifier(self):
-        """ Normalizes the reference-id.
+        """ Normalizes the reference-id: the id for contained resources
+        ("#med1"), the reference itself for relative and absolute URLs.
         """
         if not self.reference:
             return None
         
         if '#' == self.reference[0]:
             return self.reference[1:]
-        
-        # TODO: distinguish absolute (has "://") and relative URLs
+        return self.reference
+
+
+def remote_path(reference, server=None):
+    """ The REST path to read the referenced resource from the server,
+    like "Patient/23" or "Patient/23/_history/2".
+    
+    :param str reference: A relative or absolute reference
+    :param server: The server; absolute references must start with its
+        `base_uri`
+    :returns: The path, or `None` if the reference is not one to the server
+    """
+    match = _remote_ptrn.match(reference or '')
+    if match is None:
         return None
+    base = match.group('base')
+    if base is not None:
+        server_base = getattr(server, 'base_uri', None)
+        if server_base is None or base != server_base.rstrip('/'):
+            return None
+    path = '{}/{}'.format(match.group('type'), match.group('id'))
+    if match.group('version'):
+        path += '/_history/{}'.format(match.group('version'))
+    return path
+
+
+def references(element):
+    """ Yields the FHIRReference instances in the element's properties,
+    and in their properties, recursively; contained resources are not
+    included.
+    """
+    if isinstance(element, list):
+        for item in element:
+            for ref in references(item):
+                yield ref
+    elif isinstance(element, fhirelement.FHIRElement):
+        if isinstance(element, FHIRReference):
+            yield element
+        for name in element.__class__.json_keys():
+            value = getattr(element, name, None)
+            if value is not None:
+                for ref in references(value):
+                    yield ref
+
+
+def resolve_all(resources, server, batch_size=50, batch=False):
+    """ Resolves the remote references of all given resources in bulk.
+    Unresolved references are collected and deduplicated, then fetched
+    grouped by resource type: with `_id=a,b,c` searches or, with `batch`, by
+    POSTing "batch" Bundles of reads. Each referenced resource is
+    instantiated once and stored with the roots of all references to it, so
+    `resolved` returns it without another request. Resources in the shared
+    `cache` are not fetched again.
+    
+    The server needs a `request_json()` method taking a relative path; for
+    `batch` also a `post_json()` method taking a relative path and a JSON
+    dictionary. Absolute references must start with the server's
+    `base_uri`, others are skipped.
+    
+    :param resources: An iterable of resource instances
+    :param server: An instance of a FHIR server or compatible class
+    :param int batch_size: How many resources to read per request
+    :param bool batch: Whether to use batch Bundles instead of searches
+    :returns: A dict mapping the REST paths of the references to the
+        resolved instances, `None` for those the server did not return
+    """
+    if server is None:
+        raise Exception("Cannot resolve references without server instance")
+    
+    pending, resolved = _pending_references(resources, server)
+    paths = sorted(pending.keys())
+    found = {}
+    if batch:
+        for chunk, bundle in _batch_bundles(paths, batch_size):
+            try:
+                response = server.post_json('', bundle)
+            except Exception as e:
+                logging.warning("Failed to read {} resources in a batch: {}".format(len(chunk), e))
+                continue
+            _add_batch_response(found, chunk, response)
+    else:
+        for request in _search_requests(paths, batch_size):
+            try:
+                response = server.request_json(request[0])
+            except Exception as e:
+                logging.warning("Failed to request \"{}\": {}".format(request[0], e))
+                continue
+            _add_search_response(found, request, response)
+    
+    _populate(pending, found, server, resolved)
+    return resolved
+
+
+def _pending_references(resources, server):
+    """ Collects the unresolved remote references of the resources by REST
+    path; those in the shared `cache` are resolved right away.
+    
+    :returns: A tuple with a dict mapping paths to lists of references, and
+        a dict mapping the paths of resolved references to their instances
+    """
+    pending = collections.OrderedDict()
+    for resource in resources:
+        for ref in references(resource):
+            refid = ref.processedReferenceIdentifier()
+            if not refid or '#' == ref.reference[0] or ref._owner is None or ref._referenced_class is None:
+                continue
+            if ref._owner.resolvedReference(refid) is not None:
+                continue
+            path = remote_path(ref.reference, server)
+            if path is None:
+                logging.warning("Reference \"{}\" is not to {}, skipping".format(ref.reference, getattr(server, 'base_uri', 'the server')))
+                continue
+            pending.setdefault(path, []).append(ref)
+    
+    resolved = {}
+    for path in list(pending.keys()):
+        refs = pending[path]
+        instance = _cached(server, path, refs[0]._referenced_class)
+        if instance is not None and all(isinstance(instance, ref._referenced_class) for ref in refs):
+            for ref in refs:
+                ref._owner.didResolveReference(ref.processedReferenceIdentifier(), instance)
+            resolved[path] = instance
+            del pending[path]
+    return pending, resolved
+
+
+def _populate(pending, found, server, resolved):
+    """ Instantiates the fetched resources and stores them with the roots of
+    the references pointing to them.
+    """
+    for path, refs in pending.items():
+        jsondict = found.get(path)
+        if jsondict is None:
+            logging.warning("Server did not return \"{}\"".format(path))
+            resolved[path] = None
+            continue
+        instances = {}
+        for ref in refs:
+            klass = ref._referenced_class
+            instance = instances.get(klass)
+            if instance is None:
+                instance = _instantiate(jsondict, klass, server, path)
+                instances[klass] = instance
+            ref._owner.didResolveReference(ref.processedReferenceIdentifier(), instance)
+        resolved[path] = instance
+
+
+def _search_requests(paths, batch_size):
+    """ The requests reading the resources at the given paths: one `_id`
+    search per resource type and batch, versioned paths one by one.
+    
+    :returns: A list of `(request path, resource type, ids)` tuples; type and
+        ids are `None` for reads
+    """
+    requests = []
+    by_type = collections.OrderedDict()
+    for path in paths:
+        if '/_history/' in path:
+            requests.append((path, None, None))
+        else:
+            tp, rem_id = path.split('/')
+            by_type.setdefault(tp, []).append(rem_id)
     
+    for tp, ids in by_type.items():
+        for i in range(0, len(ids), batch_size):
+            chunk = ids[i:i + batch_size]
+            requests.append(('{}?_id={}&_count={}'.format(tp, ','.join(chunk), len(chunk)), tp, chunk))
+    return requests
+
+
+def _add_search_response(found, request, response):
+    """ Adds the resources of a response to a request from
+    `_search_requests()` to `found`, by path.
+    """
+    path, tp, chunk = request
+    if tp is None:
+        found[path] = response
+        return
+    for entry in response.get('entry', []):
+        jsondict = entry.get('content') or entry.get('resource')
+        if jsondict is None:
+            continue
+        rem_id = _entry_id(entry, jsondict)
+        if rem_id in chunk:
+            found['{}/{}'.format(jsondict.get('resourceType', tp), rem_id)] = jsondict
+
+
+def _batch_bundles(paths, batch_size):
+    """ "batch" Bundles with one GET per path.
+    
+    :returns: A list of `(paths, Bundle)` tuples
+    """
+    bundles = []
+    for i in range(0, len(paths), batch_size):
+        chunk = paths[i:i + batch_size]
+        bundles.append((chunk, {
+            'resourceType': 'Bundle',
+            'type': 'batch',
+            'entry': [{'request': {'method': 'GET', 'url': path}} for path in chunk],
+        }))
+    return bundles
+
+
+def _add_batch_response(found, chunk, response):
+    """ Adds the resources of a "batch-response" Bundle to `found`, by path.
+    """
+    for path, entry in zip(chunk, response.get('entry', [])):
+        status = str(entry.get('response', {}).get('status', '200'))
+        jsondict = entry.get('resource') or entry.get('content')
+        if jsondict is not None and status.startswith('2'):
+            found[path] = jsondict
+
+
+def _entry_id(entry, jsondict):
+    """ The resource id of a search result entry, from its "id" URL (DSTU1)
+    or from the resource.
+    """
+    match = _remote_ptrn.match(entry.get('id') or '')
+    if match is not None:
+        return match.group('id')
+    return jsondict.get('id')
+
+
+def _cache_key(server, path):
+    """ The absolute URL and the version id, if any, of the resource at the
+    given path on the server.
+    """
+    url, _, version = path.partition('/_history/')
+    base = getattr(server, 'base_uri', None)
+    if base:
+        url = '{}/{}'.format(base.rstrip('/'), url)
+    return url, version or None
+
+
+def _cached(server, path, klass):
+    """ The resource at the given path from the shared `cache`, if it is
+    there and a `klass`.
+    """
+    if cache is None:
+        return None
+    url, version = _cache_key(server, path)
+    instance = cache.get(url, version)
+    return instance if isinstance(instance, klass) else None
+
+
+def _cached_url(reference, klass):
+    """ The resource an absolute reference points to from the shared
+    `cache`, if it is there and a `klass`; needs no server.
+    """
+    match = _remote_ptrn.match(reference or '')
+    if cache is None or match is None or match.group('base') is None:
+        return None
+    url = '{}/{}/{}'.format(match.group('base'), match.group('type'), match.group('id'))
+    instance = cache.get(url, match.group('version'))
+    return instance if isinstance(instance, klass) else None
+
+
+def _instantiate(jsondict, klass, server, path):
+    """ Instantiates a fetched resource as the class its "resourceType"
+    names, if that is a `klass`, otherwise as `klass`, and adds it to the
+    shared `cache`.
+    """
+    instance = fhirelementfactory.instantiate(jsondict)
+    if not isinstance(instance, klass):
+        instance = klass(jsondict=jsondict)
+    instance._server = server
+    instance._remote_id = path.split('/')[1]
+    if cache is not None:
+        url, version = _cache_key(server, path)
+        cache.put(url, instance, version)
+        current = (jsondict.get('meta') or {}).get('versionId')
+        if version is None and current is not None:
+            cache.put(url, instance, current)
+    return instance
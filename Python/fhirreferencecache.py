@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  Share resolved references between resources.
+
+import time
+import threading
+import collections
+
+
+class ReferenceCache(object):
+    """ A process-wide cache of resolved resources, keyed by absolute URL and
+    version id. Set an instance as `fhirreference.cache` to have references
+    look there before asking the server; any object with the same `get()`
+    and `put()` methods works.
+    
+    The least recently used entries are evicted beyond `max_size`. Entries
+    without version id expire after `ttl` seconds, since the resource may
+    change on the server; versioned entries never change and only leave the
+    cache by eviction.
+    """
+    
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        """ The maximum number of entries. """
+        
+        self.ttl = ttl
+        """ Seconds after which unversioned entries expire; never if `None`. """
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, url, version=None):
+        """ Returns the cached resource, `None` if there is none or it expired.
+        
+        :param str url: The absolute URL of the resource, without "_history"
+        :param str version: The version id, `None` for the current version
+        """
+        key = (url, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] < time.time():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, url, instance, version=None):
+        """ Adds the resource to the cache, evicting the least recently used
+        entries if it is full.
+        """
+        expires = time.time() + self.ttl if self.ttl is not None and version is None else None
+        with self._lock:
+            self._entries[(url, version)] = (instance, expires)
+            self._entries.move_to_end((url, version))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        """ Counts of hits, misses, evictions and expirations so far, and the
+        current number of entries.
+        """
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
@@ -14,6 +14,8 @@ class FHIRResource(fhirelement.FHIRElement):
     """
     resource_name = 'Resource'
     
+    __slots__ = ('_remote_id', '_server', 'language')
+    
     def __init__(self, jsondict=None):
         self._remote_id = None
         self._server = None
@@ -23,10 +25,19 @@ class FHIRResource(fhirelement.FHIRElement):
         
         super(FHIRResource, self).__init__(jsondict)
     
-    def update_with_json(self, jsondict):
-        super(FHIRResource, self).update_with_json(jsondict)
-        if 'language' in jsondict:
-            self.language = jsondict['language']
+    @classmethod
+    def _declared_json_parsers(cls):
+        parsers = super(FHIRResource, cls)._declared_json_parsers()
+        parsers['language'] = ('language', None, None)
+        return parsers
+    
+    
+    def as_json(self):
+        js = super(FHIRResource, self).as_json()
+        js['resourceType'] = self.resource_name
+        if self.language is not None:
+            js['language'] = self.language
+        return js
     
     
     # MARK: Server Connection
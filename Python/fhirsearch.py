@@ -9,6 +9,8 @@ try:
 except Exception as e:
     from urllib.parse import quote_plus
 
+import fhirbundle
+
 
 class FHIRSearch(object):
     """ Create a FHIR search from NoSQL-like query structures.
@@ -50,7 +52,8 @@ class FHIRSearch(object):
     
     def perform(self, server):
         """ Construct the search URL and execute it against the given server.
-        :returns: A list of instances created from returned data (TODO)
+        :returns: A list of instances created from returned data, each of the
+            class named by its "resourceType"
         """
         if server is None:
             raise Exception("Need a server to perform search")
@@ -58,13 +61,33 @@ class FHIRSearch(object):
             raise Exception("Need resource_type set to perform search")
         
         res = server.request_json(self.construct())
-        cls = self.resource_type
-        instances = []
-        if 'entry' in res:
-            for entry in res['entry']:
-                if 'content' in entry:
-                    instances.append(cls(jsondict=entry['content']))
-        return instances
+        return list(fhirbundle.instantiate(res.get('entry', []), self.resource_type))
+    
+    def perform_iter(self, server):
+        """ Like `perform()`, but yields instances one at a time, each of the
+        class named by its "resourceType". If the server has a
+        `request_stream()` method, returning a file-like object for a relative
+        path, the Bundle is read incrementally and memory stays proportional
+        to one entry; otherwise it is loaded with `request_json()` first.
+        
+        :returns: A generator of instances created from returned data
+        """
+        if server is None:
+            raise Exception("Need a server to perform search")
+        if self.resource_type is None:
+            raise Exception("Need resource_type set to perform search")
+        
+        if hasattr(server, 'request_stream'):
+            stream = server.request_stream(self.construct())
+            try:
+                for instance in fhirbundle.BundleReader(stream).resources(self.resource_type):
+                    yield instance
+            finally:
+                stream.close()
+        else:
+            res = server.request_json(self.construct())
+            for instance in fhirbundle.instantiate(res.get('entry', []), self.resource_type):
+                yield instance
 
 
 class FHIRSearchParam(object):
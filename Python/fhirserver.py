@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  Talk to a FHIR server over pooled keep-alive connections.
+
+import gzip
+import json
+import queue
+import threading
+import http.client
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+
+class FHIRServer(object):
+    """ A FHIR server at the given base URI, implementing the protocol the
+    models use: `request_json()`, `request_stream()` and `post_json()`, each
+    taking a path relative to the base URI.
+    
+    Connections are kept alive and reused; at most `max_connections` are
+    open at any time, further requests wait for one to become free, so one
+    instance can be shared by many threads. Responses are requested gzipped
+    and request bodies of at least `gzip_min_size` bytes are sent gzipped.
+    """
+    
+    def __init__(self, base_uri, max_connections=8, timeout=30, gzip_min_size=1024):
+        parsed = urlparse(base_uri)
+        if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+            raise Exception("Need an http or https base URI, but got \"{}\"".format(base_uri))
+        
+        self.base_uri = base_uri.rstrip('/')
+        """ The server's base URI, references starting with it are to this server. """
+        
+        self.max_connections = max_connections
+        self.timeout = timeout
+        
+        self.gzip_min_size = gzip_min_size
+        """ Request bodies of at least this many bytes are gzipped; never if `None`. """
+        
+        self.headers = {'Accept': 'application/json+fhir'}
+        """ Headers sent with every request. """
+        
+        self._scheme = parsed.scheme
+        self._netloc = parsed.netloc
+        self._path = parsed.path.rstrip('/')
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+    
+    def __repr__(self):
+        return '<FHIRServer {}>'.format(self.base_uri)
+    
+    
+    # MARK: Requests
+    
+    def request_json(self, path):
+        """ GETs the given path and decodes the JSON response.
+        
+        :param str path: The path relative to the base URI, like "Patient/23"
+        :returns: The decoded JSON, usually a dictionary
+        """
+        return json.loads(self.request('GET', path).decode('utf-8'))
+    
+    def request_json_many(self, paths, max_workers=None):
+        """ GETs all the given paths concurrently, over at most `max_workers`
+        threads, and decodes the JSON responses. Raises the exception of the
+        first failed request, in order of the paths.
+        
+        :param paths: An iterable of paths relative to the base URI
+        :param int max_workers: The number of threads, `max_connections` if
+            `None`
+        :returns: A list of the decoded responses, in order of the paths
+        """
+        paths = list(paths)
+        if len(paths) < 2:
+            return [self.request_json(path) for path in paths]
+        with ThreadPoolExecutor(min(max_workers or self.max_connections, len(paths))) as pool:
+            return list(pool.map(self.request_json, paths))
+    
+    def post_json(self, path, jsondict):
+        """ POSTs the JSON dictionary to the given path and decodes the JSON
+        response.
+        
+        :param str path: The path relative to the base URI, "" for the base
+        :param dict jsondict: The JSON to send
+        :returns: The decoded JSON response, `None` if there is none
+        """
+        body = json.dumps(jsondict).encode('utf-8')
+        headers = {'Content-Type': 'application/json+fhir; charset=utf-8'}
+        data = self.request('POST', path, body, headers)
+        return json.loads(data.decode('utf-8')) if data else None
+    
+    def request_stream(self, path):
+        """ GETs the given path and returns the response as a file-like
+        object, for reading large Bundles incrementally; its connection is
+        freed when it is closed.
+        """
+        conn, response = self._send('GET', path)
+        return _Stream(self, conn, response)
+    
+    def request(self, method, path, body=None, headers=None):
+        """ Performs a request over a pooled connection.
+        
+        :param str method: The HTTP method
+        :param str path: The path relative to the base URI
+        :param bytes body: The request body
+        :param dict headers: Headers in addition to `headers`
+        :returns: The response body as bytes, ungzipped
+        """
+        conn, response = self._send(method, path, body, headers)
+        try:
+            data = response.read()
+        except Exception:
+            self._release(conn, close=True)
+            raise
+        self._release(conn, close=response.will_close)
+        if 'gzip' == response.getheader('Content-Encoding'):
+            data = gzip.decompress(data)
+        return data
+    
+    def close(self):
+        """ Closes the idle connections.
+        """
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+    
+    
+    # MARK: Connections
+    
+    def _send(self, method, path, body=None, headers=None):
+        """ Sends the request and reads the response status and headers,
+        retrying GETs and HEADs once on a fresh connection if a kept-alive one
+        was closed by the server in the meantime; other requests may have
+        been processed already and are not sent again.
+        
+        :returns: A tuple with the connection, still taken, and the response
+        """
+        url = '{}/{}'.format(self._path, path)
+        all_headers = dict(self.headers)
+        all_headers['Accept-Encoding'] = 'gzip'
+        if headers is not None:
+            all_headers.update(headers)
+        if body is not None and self.gzip_min_size is not None and len(body) >= self.gzip_min_size:
+            body = gzip.compress(body)
+            all_headers['Content-Encoding'] = 'gzip'
+        
+        self._slots.acquire()
+        conn, reused = self._connection()
+        while True:
+            try:
+                conn.request(method, url, body, all_headers)
+                response = conn.getresponse()
+                break
+            except (http.client.RemoteDisconnected, ConnectionError):
+                conn.close()
+                if not reused or method not in ('GET', 'HEAD'):
+                    self._slots.release()
+                    raise
+                conn, reused = self._new_connection(), False
+            except Exception:
+                conn.close()
+                self._slots.release()
+                raise
+        
+        if response.status >= 400:
+            try:
+                data = response.read()
+                if 'gzip' == response.getheader('Content-Encoding'):
+                    data = gzip.decompress(data)
+            except Exception:
+                self._release(conn, close=True)
+                raise
+            self._release(conn, close=response.will_close)
+            raise Exception("{} {} failed with status {}: {}".format(method, url, response.status, data[:200].decode('utf-8', 'replace')))
+        return conn, response
+    
+    def _connection(self):
+        """ An idle connection, or a new one if there is none.
+        
+        :returns: A tuple with the connection and whether it was used before
+        """
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._new_connection(), False
+    
+    def _new_connection(self):
+        if 'https' == self._scheme:
+            return http.client.HTTPSConnection(self._netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(self._netloc, timeout=self.timeout)
+    
+    def _release(self, conn, close=False):
+        """ Puts the connection back into the pool, or closes it, and frees
+        its slot.
+        """
+        if close:
+            conn.close()
+        else:
+            self._idle.put(conn)
+        self._slots.release()
+
+
+class _Stream(object):
+    """ The body of a response, ungzipped if needed, giving its connection
+    back to the server when closed.
+    """
+    
+    def __init__(self, server, conn, response):
+        self._server = server
+        self._conn = conn
+        self._response = response
+        self._body = response
+        if 'gzip' == response.getheader('Content-Encoding'):
+            self._body = gzip.GzipFile(fileobj=response)
+    
+    def read(self, size=-1):
+        return self._body.read(size)
+    
+    def close(self):
+        if self._conn is not None:
+            complete = self._response.isclosed()          # read to the end, the connection can be reused
+            self._server._release(self._conn, close=not complete or self._response.will_close)
+            self._conn = None
@@ -4,6 +4,7 @@ from Python.mappings import *
 
 # where to load the specification archive from
 specification_url = 'http://hl7.org/documentcenter/public/standards/FHIR/fhir-spec.zip'
+specification_sha256 = None                             # SHA-256 hex digest the downloaded archive must have, if known
 
 # classes/resources
 write_resources = True
@@ -12,20 +13,31 @@ tpl_resource_source = 'Python/template-resource.py'     # the template to use as
 tpl_resource_target_ptrn = '../models/{}.py'            # where to write the generated class files to, with one placeholder for the class name
 resource_base_target = '../models/'                     # resource target directory, likely the same as `tpl_resource_target_ptrn` without the filename pattern
 resource_default_base = 'FHIRElement'                   # the default superclass to use
+resource_slots = False                                  # whether classes should declare `__slots__`; instances then can't take other attributes
 resource_baseclasses = [                                # all these files should be copied to `resource_base_target`
     'Python/__init__.py',
     'Python/fhirelement.py',
     'Python/fhirresource.py',
     'Python/fhircontainedresource.py',
     'Python/fhirreference.py',
+    'Python/fhirreferencecache.py',
     'Python/fhirdate.py',
     'Python/fhirsearch.py',
+    'Python/fhirserver.py',
+    'Python/fhirasync.py',
+    'Python/fhirbundle.py',
+    'Python/fhirbulk.py',
+    'Python/fhirintern.py',
 ]
+resource_baseclass_profiles = ['Extension', 'ResourceReference'] # profiles the base classes depend on, always generated with `--only`
+
+# content hashes of inputs and outputs of the last run; unchanged profiles are skipped on subsequent runs
+manifest_target = '../models/.fhir-manifest.json'
 
 # factory methods
-write_factory = False
+write_factory = True
 tpl_factory_source = 'Python/template-elementfactory.py'
-tpl_factory_target = '../models/fhirelement+factory.py'
+tpl_factory_target = '../models/fhirelementfactory.py'
 
 # search parameters
 write_searchparams = True
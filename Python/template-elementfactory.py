@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  Generated from FHIR {{ info.version }} on {{ info.date }}.
+#  {{ info.year }}, SMART Platforms.
+
+import importlib
+
+
+modules = {
+{%- for klass in classes|sort %}
+    '{{ klass }}': '{% if info.lowercase_import_hack %}{{ klass|lower }}{% else %}{{ klass }}{% endif %}',
+{%- endfor %}
+}
+""" Maps resource types to the module defining the class of the same name. """
+
+_classes = {}
+
+
+def resource_class(resource_type):
+    """ Returns the class for the given resource type, importing its module
+    on first use.
+    
+    :param str resource_type: The resource type, like "Patient"
+    :returns: The class, or `None` for unknown resource types
+    """
+    klass = _classes.get(resource_type)
+    if klass is None and resource_type in modules:
+        klass = getattr(importlib.import_module(modules[resource_type]), resource_type)
+        _classes[resource_type] = klass
+    return klass
+
+
+def instantiate(jsondict, default=None):
+    """ Instantiates the class named by the dictionary's "resourceType".
+    
+    :param dict jsondict: A resource's JSON dictionary
+    :param default: The class to use for unknown resource types
+    :returns: An instance, or `None` if the resource type is unknown and there
+        is no default class
+    """
+    klass = resource_class(jsondict.get('resourceType')) or default
+    return klass(jsondict=jsondict) if klass is not None else None
@@ -7,6 +7,9 @@
 {% for imp in info.imports %}
 import {% if info.lowercase_import_hack %}{{ imp|lower }}{% else %}{{ imp }}{% endif %}
 {%- endfor %}
+{%- if info.interned %}
+import fhirintern
+{%- endif %}
 
 {%- for klass in classes %}
 
@@ -24,13 +27,20 @@ class {{ klass.className }}({% if klass.superclass in info.imports %}
     
     resource_name = "{{ klass.resourceName }}"
 {%- endif %}
+{%- if info.slots %}
+{%- set slots = klass.properties|map(attribute='name')|unique|list %}
+    
+    {% filter wordwrap(75, wrapstring="\n        ") -%}
+    __slots__ = ({% for name in slots %}'{{ name }}'{% if not loop.last %}, {% endif %}{% endfor %}{% if 1 == slots|length %},{% endif %})
+    {%- endfilter %}
+{%- endif %}
     
     def __init__(self, jsondict=None):
         """ Initialize all valid properties.
         """
     {%- for prop in klass.properties %}
         
-        self.{{ prop.name }} = {% if "bool" == prop.className %}False{% else %}None{% endif %}
+        self.{{ prop.name }} = None
         """ {{ prop.short|wordwrap(67, wrapstring="\n        ") }}.
         {% if prop.isArray %}List of{% else %}Type{% endif %} `{{ prop.className }}`{% if prop.isArray %} items{% endif %}
         {%- if prop.isReferenceTo %} referencing `{{ prop.isReferenceTo }}`{% endif %}
@@ -41,24 +51,33 @@ class {{ klass.className }}({% if klass.superclass in info.imports %}
     
 {%- if klass.properties %}
     
-    def update_with_json(self, jsondict):
-        super({{ klass.className }}, self).update_with_json(jsondict)
+    @classmethod
+    def _declared_json_parsers(cls):
+        parsers = super({{ klass.className }}, cls)._declared_json_parsers()
+        parsers.update({
         {%- for prop in klass.properties %}
-        if '{{ prop.name }}' in jsondict:
-            {%- if prop.isNative %}
-            self.{{ prop.name }} = jsondict['{{ prop.name }}']
-            {%- else %}{% if prop.isReferenceTo %}
-            self.{{ prop.name }} = {% if prop.className in info.imports %}
+            '{{ prop.orig_name }}': ('{{ prop.name }}', {% if prop.isInterned %}fhirintern.string_class(), None{% else %}{% if prop.isNative %}None, None{% else %}{% if prop.className in info.imports %}
                 {%- if info.lowercase_import_hack %}{{ prop.className|lower }}{% else %}{{ prop.className }}{% endif %}.{% endif -%}
-                {{ prop.className }}.with_json_and_owner(jsondict['{{ prop.name }}'], self, {% if prop.isReferenceTo in info.imports %}
+                {{ prop.className }}, {% if prop.isReferenceTo %}{% if prop.isReferenceTo in info.imports %}
                     {%- if info.lowercase_import_hack %}{{ prop.isReferenceTo|lower }}{% else %}{{ prop.isReferenceTo }}{% endif %}.{% endif -%}
-                {{ prop.isReferenceTo }})
+                {{ prop.isReferenceTo }}{% else %}None{% endif %}{% endif %}{% endif %}),
+        {%- endfor %}
+        })
+        return parsers
+    
+    def as_json(self):
+        js = super({{ klass.className }}, self).as_json()
+        {%- for prop in klass.properties %}
+        if self.{{ prop.name }} is not None:
+            {%- if prop.isNative %}
+            js['{{ prop.orig_name }}'] = self.{{ prop.name }}
+            {%- else %}{% if prop.isArray %}
+            js['{{ prop.orig_name }}'] = [item.as_json() for item in self.{{ prop.name }}]
             {%- else %}
-            self.{{ prop.name }} = {% if prop.className in info.imports %}
-                {%- if info.lowercase_import_hack %}{{ prop.className|lower }}{% else %}{{ prop.className }}{% endif %}.{% endif -%}
-                {{ prop.className }}.with_json_and_owner(jsondict['{{ prop.name }}'], self)
+            js['{{ prop.orig_name }}'] = self.{{ prop.name }}.as_json()
             {%- endif %}{% endif %}
         {%- endfor %}
+        return js
     
 {%- endif %}
 {%- endfor %}
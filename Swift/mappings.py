@@ -62,6 +62,10 @@ starexpandtypes = {
 # Which class names are native to the lannguage
 natives = ['Bool', 'Int', 'String', 'NSNumber', 'NSDecimalNumber', 'NSDate', 'NSURL']
 
+# Which FHIR types have values repeating across resources, like code systems;
+# these can be interned when parsing
+interntypes = []
+
 # Which classes are to be expected from JSON decoding
 jsonmap = {
 	'FHIRElement': 'NSDictionary',
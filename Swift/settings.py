@@ -4,6 +4,7 @@ from Swift.mappings import *
 
 # where to load the specification archive from
 specification_url = 'http://hl7.org/documentcenter/public/standards/FHIR/fhir-spec.zip'
+specification_sha256 = None                             # SHA-256 hex digest the downloaded archive must have, if known
 
 # classes/resources
 write_resources = True
@@ -12,6 +13,7 @@ tpl_resource_source = 'Swift/template-resource.swift'       # the template to us
 tpl_resource_target_ptrn = '../Models/{}.swift'             # where to write the generated class files to, with one placeholder for the class name
 resource_base_target = '../Models/'                         # resource target directory, likely the same as `tpl_resource_target_ptrn` without the filename pattern
 resource_default_base = 'FHIRElement'                       # the default superclass to use
+resource_slots = False                                      # whether classes should declare `__slots__`; not used for Swift
 resource_baseclasses = [                                    # all these files should be copied to `resource_base_target`
     'Swift/FHIRElement.swift',
     'Swift/FHIRResource.swift',
@@ -20,6 +22,10 @@ resource_baseclasses = [                                    # all these files sh
     'Swift/FHIRSearchParam.swift',
     'Swift/JSON-extensions.swift',
 ]
+resource_baseclass_profiles = ['Extension', 'ResourceReference'] # profiles the base classes depend on, always generated with `--only`
+
+# content hashes of inputs and outputs of the last run; unchanged profiles are skipped on subsequent runs
+manifest_target = '../Models/.fhir-manifest.json'
 
 # factory methods
 write_factory = False
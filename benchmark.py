@@ -0,0 +1,587 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  Benchmarks for the FHIR class generator
+#  Run from the directory containing `generate.py` and your `settings.py`
+
+import io
+import gc
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import importlib
+import tracemalloc
+from jinja2 import Environment, PackageLoader
+
+import generate
+import synthetic
+
+
+def synthetic_classes(name, num_properties):
+    """ Creates the FHIRClass of one resource with the given number of
+    properties, as `process_profile()` would.
+    """
+    types = ['string', 'code', 'dateTime', 'boolean', 'CodeableConcept', 'ResourceReference']
+    klass = generate.parse_elem(name, name, {'short': name, 'formal': None, 'min': 0, 'max': '1', 'type': [{'code': 'Resource'}]}, None)
+    for i in range(num_properties):
+        definition = {
+            'short': 'Property {}'.format(i),
+            'formal': None,
+            'min': i % 2,
+            'max': '*' if i % 3 else '1',
+            'type': [{'code': types[i % len(types)]}],
+        }
+        generate.parse_elem('{}.prop{}'.format(name, i), 'prop{}'.format(i), definition, klass)
+    return [klass]
+
+
+def bench_render(num_files=200, num_properties=40):
+    """ Renders `num_files` resource files the way `render()` did before
+    compiled templates were cached (fresh environment without bytecode
+    cache, `get_template()` for every file) and the way it does now
+    (bytecode cache, template compiled once).
+    
+    :returns: A dict with the timings, per-file costs in milliseconds
+    """
+    tpl = generate.tpl_resource_source
+    data = []
+    for i in range(num_files):
+        name = 'Resource{}'.format(i)
+        info = {'version': 'X', 'date': '', 'year': 0, 'filename': name, 'imports': [], 'lowercase_import_hack': True}
+        data.append({'info': info, 'classes': synthetic_classes(name, num_properties)})
+    
+    # before: every run compiles from scratch and looks up the template for every file
+    start = time.perf_counter()
+    env = Environment(loader=PackageLoader('generate', '.'))
+    env.filters['wordwrap'] = generate.do_wordwrap
+    first = None
+    for d in data:
+        env.get_template(tpl).render(d)
+        if first is None:
+            first = time.perf_counter() - start
+    before = time.perf_counter() - start
+    
+    # after: warm bytecode cache, as on every run but the first, template loaded once
+    directory = tempfile.mkdtemp()
+    try:
+        warm = Environment(loader=PackageLoader('generate', '.'), bytecode_cache=generate.TemplateBytecodeCache(directory))
+        warm.get_template(tpl)
+        
+        start = time.perf_counter()
+        env = Environment(loader=PackageLoader('generate', '.'), bytecode_cache=generate.TemplateBytecodeCache(directory), auto_reload=False)
+        env.filters['wordwrap'] = generate.do_wordwrap
+        template = env.get_template(tpl)
+        first_after = None
+        for d in data:
+            template.render(d)
+            if first_after is None:
+                first_after = time.perf_counter() - start
+        after = time.perf_counter() - start
+    finally:
+        shutil.rmtree(directory)
+    
+    return {
+        'files': num_files,
+        'properties': num_properties,
+        'before': {
+            'total_ms': before * 1000,
+            'first_file_ms': first * 1000,
+            'per_file_ms': before * 1000 / num_files,
+        },
+        'after': {
+            'total_ms': after * 1000,
+            'first_file_ms': first_after * 1000,
+            'per_file_ms': after * 1000 / num_files,
+        },
+    }
+
+
+# MARK: Phases
+
+def _measure(func, items):
+    """ Runs `func` twice, once for timing and once with tracemalloc for
+    its peak memory allocation.
+    
+    :returns: A tuple with the phase's measurements and `func`'s result
+    """
+    gc.collect()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    result = func()
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    
+    gc.collect()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    
+    return {
+        'items': items,
+        'wall_s': wall,
+        'cpu_s': cpu,
+        'per_second': items / wall if wall > 0 else None,
+        'peak_alloc_bytes': peak,
+    }, result
+
+
+def bench_spec(num_profiles=100, num_elements=30, choice_share=0.1, star_share=0.02, jobs=1, seed=0):
+    """ Generates a synthetic spec and times the generator's phases on it:
+    `parse_profile()` (JSON loading plus `parse_elem()`), `parse_elem()`
+    alone, `render_profile()`, `process_profile()` and the whole `parse()`.
+    
+    :returns: A dict suitable for JSON output
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        spec_dir = os.path.join(directory, 'site')
+        num_written = synthetic.write_spec(spec_dir, num_profiles, num_elements, choice_share, star_share, seed=seed)
+        synthetic.redirect_output(os.path.join(directory, 'models'))
+        spec = generate.SpecDirectory(spec_dir)
+        profiles = spec.glob('*.profile.json')
+        info = {'version': 'X', 'date': '', 'year': 0, 'lowercase_import_hack': generate.ptrn_filenames_lowercase}
+        generate.load_template(generate.tpl_resource_source)
+        phases = {}
+        
+        phases['parse_profile'], parsed = _measure(lambda: [generate.parse_profile(p, spec) for p in profiles], len(profiles))
+        parsed = [p for p in parsed if p is not None]
+        
+        # time spent in parse_elem() only
+        original = generate.parse_elem
+        spent = [0.0, 0]
+        def timed_parse_elem(*args):
+            start = time.perf_counter()
+            try:
+                return original(*args)
+            finally:
+                spent[0] += time.perf_counter() - start
+                spent[1] += 1
+        generate.parse_elem = timed_parse_elem
+        try:
+            for p in profiles:
+                generate.parse_profile(p, spec)
+        finally:
+            generate.parse_elem = original
+        phases['parse_elem'] = {
+            'items': spent[1],
+            'wall_s': spent[0],
+            'per_second': spent[1] / spent[0] if spent[0] > 0 else None,
+        }
+        
+        phases['render'], _ = _measure(lambda: [generate.render_profile(p, info) for p in parsed], len(parsed))
+        phases['process_profile'], _ = _measure(lambda: [generate.process_profile(p, info, spec) for p in profiles], len(profiles))
+        phases['parse'], _ = _measure(lambda: generate.parse(spec, jobs), len(profiles))
+    finally:
+        shutil.rmtree(directory)
+    
+    try:
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        max_rss = None
+    
+    return {
+        'spec': {
+            'profiles': num_profiles,
+            'elements': num_elements,
+            'elements_written': num_written,
+            'choice_share': choice_share,
+            'star_share': star_share,
+            'jobs': jobs,
+            'seed': seed,
+        },
+        'phases': phases,
+        'max_rss_kb': max_rss,
+        'python': sys.version.split()[0],
+    }
+
+
+# MARK: Models
+
+def _load_resources(paths):
+    """ Reads resources from JSON files; Bundles contribute the content of
+    each entry.
+    """
+    resources = []
+    for path in paths:
+        with io.open(path, 'r', encoding='utf-8') as handle:
+            js = json.load(handle)
+        if 'entry' in js and 'resourceType' not in js or 'Bundle' == js.get('resourceType'):
+            resources.extend(entry['content'] for entry in js.get('entry', []) if 'content' in entry)
+        else:
+            resources.append(js)
+    return resources
+
+
+def _model_class(resource_type):
+    module = resource_type.lower() if generate.ptrn_filenames_lowercase else resource_type
+    return getattr(importlib.import_module(module), resource_type)
+
+
+def _use_models(directory, models, paths, num_profiles, num_elements, choice_share, star_share, seed):
+    """ Makes the models in `models` importable or, if no models are given,
+    generates models and examples from a synthetic spec in `directory`.
+    
+    :returns: The paths of the resource files to use
+    """
+    if models is None:
+        spec_dir = os.path.join(directory, 'site')
+        synthetic.write_spec(spec_dir, num_profiles, num_elements, choice_share, star_share, seed=seed)
+        synthetic.generate_models(spec_dir, os.path.join(directory, 'models'))
+        return generate.SpecDirectory(spec_dir).glob('*-example.json')
+    sys.path.insert(0, os.path.abspath(models))
+    return paths
+
+
+def bench_roundtrip(models=None, paths=None, repeat=20, num_profiles=100, num_elements=30, choice_share=0.1, star_share=0.02, seed=0):
+    """ Times instantiating generated model classes from JSON dictionaries
+    against serializing them back with `as_json()`, with `json.loads()` and
+    `json.dumps()` for comparison. Uses the models in `models` and the
+    resources in `paths` or, if no models are given, generates models and
+    examples from a synthetic spec.
+    
+    :returns: A dict suitable for JSON output
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        paths = _use_models(directory, models, paths, num_profiles, num_elements, choice_share, star_share, seed)
+        resources = _load_resources(paths) * repeat
+        classes = [_model_class(js['resourceType']) for js in resources]
+        texts = [json.dumps(js) for js in resources]
+        phases = {}
+        
+        phases['json_loads'], _ = _measure(lambda: [json.loads(text) for text in texts], len(texts))
+        phases['parse'], instances = _measure(lambda: [klass(js) for klass, js in zip(classes, resources)], len(resources))
+        phases['as_json'], dicts = _measure(lambda: [inst.as_json() for inst in instances], len(instances))
+        phases['json_dumps'], _ = _measure(lambda: [json.dumps(js) for js in dicts], len(dicts))
+        mismatches = sum(1 for js, out in zip(resources, dicts) if js != out) // repeat
+    finally:
+        shutil.rmtree(directory)
+    
+    return {
+        'resources': len(resources) // repeat,
+        'repeat': repeat,
+        'bytes': sum(len(text) for text in texts) // repeat,
+        'roundtrip_mismatches': mismatches,
+        'phases': phases,
+        'python': sys.version.split()[0],
+    }
+
+
+def _retained(func):
+    """ Runs `func` with tracemalloc and returns the bytes still allocated
+    afterwards, while its result is alive, along with the result.
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    gc.collect()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return current, result
+
+
+def bench_intern(models=None, paths=None, repeat=20, num_profiles=100, num_elements=30, choice_share=0.1, star_share=0.02, seed=0):
+    """ Instantiates models from freshly decoded JSON with and without
+    `fhirintern`, timing both and measuring the memory the instances keep.
+    Uses the same models and resources as `bench_roundtrip()`; mismatches
+    count interned instances that serialize differently from plain ones.
+    
+    :returns: A dict suitable for JSON output
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        paths = _use_models(directory, models, paths, num_profiles, num_elements, choice_share, star_share, seed)
+        import fhirintern
+        
+        resources = _load_resources(paths)
+        classes = [_model_class(js['resourceType']) for js in resources] * repeat
+        texts = [json.dumps(js) for js in resources] * repeat
+        
+        def parse():
+            return [klass(json.loads(text)) for klass, text in zip(classes, texts)]
+        
+        phases = {}
+        phases['plain'], _ = _measure(parse, len(texts))
+        phases['plain']['retained_bytes'], plain = _retained(parse)
+        expected = [inst.as_json() for inst in plain[:len(resources)]]
+        del plain
+        
+        fhirintern.enable()
+        try:
+            phases['interned'], _ = _measure(parse, len(texts))
+            fhirintern.disable()
+            fhirintern.enable()
+            fhirintern.reset_report()
+            phases['interned']['retained_bytes'], interned = _retained(parse)
+            report = fhirintern.report()
+            mismatches = sum(1 for js, inst in zip(expected, interned) if js != inst.as_json())
+            del interned
+        finally:
+            fhirintern.disable()
+    finally:
+        shutil.rmtree(directory)
+    
+    return {
+        'resources': len(resources),
+        'repeat': repeat,
+        'mismatches': mismatches,
+        'report': report,
+        'phases': phases,
+        'python': sys.version.split()[0],
+    }
+
+
+# MARK: References
+
+def _references(element, found):
+    """ Collects all FHIRReference instances below the given element.
+    """
+    if isinstance(element, list):
+        for item in element:
+            _references(item, found)
+    elif hasattr(element.__class__, 'json_keys'):
+        if hasattr(element, '_referenced_class'):
+            found.append(element)
+        for name in element.__class__.json_keys():
+            value = getattr(element, name, None)
+            if value is not None:
+                _references(value, found)
+    return found
+
+
+def _resolve_walking(ref):
+    """ Resolves a contained reference the way FHIRReference did before
+    elements knew their root: walking the owner chain for resolved
+    references on every access, and again to store a new one.
+    """
+    refid = ref.processedReferenceIdentifier()
+    node = ref._owner
+    while node is not None:
+        if node._resolved and refid in node._resolved:
+            return node._resolved[refid]
+        node = node._owner
+    
+    instance = ref._referenced_class(jsondict=ref._owner.containedReference(refid).json)
+    node = ref._owner
+    while node._owner is not None:
+        node = node._owner
+    node._resolved = node._resolved or {}
+    node._resolved[refid] = instance
+    return instance
+
+
+def bench_references(depth=6, num_references=10000, num_contained=5, rounds=5):
+    """ Resolves `num_references` references, nested `depth` levels deep in
+    one resource, to `num_contained` contained resources; `rounds` times,
+    starting from an empty cache. Compares walking the owner chain, as
+    FHIRReference did before, with the cache kept by the root resource.
+    
+    :returns: A dict suitable for JSON output
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        spec_dir = os.path.join(directory, 'site')
+        synthetic.write_spec(spec_dir, num_profiles=0, examples=False)
+        synthetic.write_profile(spec_dir, 'Target', 'Resource', [
+            synthetic.element('Target.name', ['string']),
+            synthetic.element('Target.code', ['code']),
+        ], [])
+        path = 'Holder'
+        elements = []
+        for level in range(depth):
+            path = '{}.level{}'.format(path, level)
+            elements.append(synthetic.element(path, None, '*'))
+        elements.append(synthetic.element('{}.subject'.format(path), ['ResourceReference'], '1', 'Target'))
+        synthetic.write_profile(spec_dir, 'Holder', 'Resource', elements, [])
+        
+        synthetic.generate_models(spec_dir, os.path.join(directory, 'models'))
+        
+        leaves = [{'subject': {'reference': '#t{}'.format(i % num_contained)}} for i in range(num_references)]
+        js = leaves
+        for level in reversed(range(1, depth)):
+            js = [{'level{}'.format(level): js}]
+        js = {
+            'resourceType': 'Holder',
+            'contained': [{'resourceType': 'Target', 'id': 't{}'.format(i), 'name': 'Target {}'.format(i), 'code': 'c'} for i in range(num_contained)],
+            'level0': js,
+        }
+        holder = _model_class('Holder')(js)
+        refs = _references(holder, [])
+        
+        def resolve(func):
+            holder._resolved = None
+            for i in range(rounds):
+                for ref in refs:
+                    func(ref)
+            return len(set(id(func(ref)) for ref in refs))
+        
+        phases = {}
+        phases['walk'], walk_instances = _measure(lambda: resolve(_resolve_walking), len(refs) * rounds)
+        phases['root'], root_instances = _measure(lambda: resolve(lambda ref: ref.resolved), len(refs) * rounds)
+    finally:
+        shutil.rmtree(directory)
+    
+    return {
+        'depth': depth,
+        'references': len(refs),
+        'contained': num_contained,
+        'rounds': rounds,
+        'instances': {'walk': walk_instances, 'root': root_instances},
+        'phases': phases,
+        'python': sys.version.split()[0],
+    }
+
+
+# MARK: Dates
+
+_date_like = re.compile(r'^\d{4}(-\d{2}(-\d{2}(T[0-9:.]+(Z|[+-][0-9:]+)?)?)?)?$')
+
+
+def _collect_strings(js, matching, found):
+    if isinstance(js, dict):
+        for value in js.values():
+            _collect_strings(value, matching, found)
+    elif isinstance(js, list):
+        for value in js:
+            _collect_strings(value, matching, found)
+    elif isinstance(js, str) and matching.match(js):
+        found.append(js)
+
+
+def bench_dates(directory, repeat=10):
+    """ Times parsing and formatting the date-like strings of all examples in
+    the given spec directory with isodate, as FHIRDate did before, against
+    FHIRDate's precompiled patterns without and with the memo cache, and
+    instantiating FHIRDate with and without deferred parsing.
+    
+    :returns: A dict suitable for JSON output
+    """
+    if os.path.abspath('Python') not in sys.path:
+        sys.path.insert(0, os.path.abspath('Python'))
+    import isodate
+    import datetime
+    import fhirdate
+    
+    values = []
+    for path in generate.SpecDirectory(directory).glob('*-example*.json'):
+        with io.open(path, 'r', encoding='utf-8') as handle:
+            _collect_strings(json.load(handle), _date_like, values)
+    values = values * repeat
+    
+    def isodate_parse(val):
+        return isodate.parse_datetime(val) if 'T' in val else isodate.parse_date(val)
+    
+    def isodate_format(date):
+        if isinstance(date, datetime.datetime):
+            return isodate.datetime_isoformat(date)
+        return isodate.date_isoformat(date)
+    
+    phases = {}
+    phases['isodate_parse'], dates = _measure(lambda: [isodate_parse(v) for v in values], len(values))
+    phases['pattern_parse'], fast = _measure(lambda: [fhirdate._parse(v) for v in values], len(values))
+    fhirdate.parse.cache_clear()
+    phases['memo_parse'], _ = _measure(lambda: [fhirdate.parse(v) for v in values], len(values))
+    
+    instances = [fhirdate.FHIRDate(v) for v in values]
+    phases['isodate_isostring'], expected = _measure(lambda: [isodate_format(d) for d in dates], len(dates))
+    phases['isostring'], formatted = _measure(lambda: [inst.isostring for inst in instances], len(instances))
+    
+    # deferred mode keeps the string, parsing only when `date` is read
+    fhirdate.FHIRDate.deferred = True
+    try:
+        phases['deferred_init'], deferred = _measure(lambda: [fhirdate.FHIRDate(v) for v in values], len(values))
+        phases['deferred_isostring'], _ = _measure(lambda: [inst.isostring for inst in deferred], len(deferred))
+    finally:
+        fhirdate.FHIRDate.deferred = False
+    phases['init'], _ = _measure(lambda: [fhirdate.FHIRDate(v) for v in values], len(values))
+    
+    return {
+        'values': len(values) // repeat,
+        'distinct': len(set(values)),
+        'repeat': repeat,
+        'mismatches': sum(1 for a, b in zip(dates, fast) if a != b) + sum(1 for a, b in zip(expected, formatted) if a != b),
+        'cache': fhirdate.parse.cache_info()._asdict(),
+        'phases': phases,
+        'python': sys.version.split()[0],
+    }
+
+
+if '__main__' == __name__:
+    parser = argparse.ArgumentParser(description="Benchmark the FHIR class generator")
+    sub = parser.add_subparsers(dest='benchmark')
+    render = sub.add_parser('render', help="per-file render cost with and without compiled-template caching")
+    render.add_argument('--files', type=int, default=200)
+    render.add_argument('--properties', type=int, default=40)
+    spec = sub.add_parser('spec', help="time each generator phase on a synthetic spec")
+    spec.add_argument('--profiles', type=int, default=100)
+    spec.add_argument('--elements', type=int, default=30, help="elements per profile")
+    spec.add_argument('--choice', type=float, default=0.1, help="share of value[x] elements")
+    spec.add_argument('--star', type=float, default=0.02, help="share of elements of type *")
+    spec.add_argument('-j', dest='jobs', type=int, default=1, help="worker processes for the parse() phase")
+    spec.add_argument('--seed', type=int, default=0)
+    roundtrip = sub.add_parser('roundtrip', help="instantiating generated models from JSON against serializing them with as_json()")
+    roundtrip.add_argument('--models', help="directory of generated models to use instead of a synthetic spec")
+    roundtrip.add_argument('files', nargs='*', help="resource or Bundle JSON files, with --models")
+    roundtrip.add_argument('--repeat', type=int, default=20)
+    roundtrip.add_argument('--profiles', type=int, default=100)
+    roundtrip.add_argument('--elements', type=int, default=30, help="elements per profile")
+    roundtrip.add_argument('--choice', type=float, default=0.1, help="share of value[x] elements")
+    roundtrip.add_argument('--star', type=float, default=0.02, help="share of elements of type *")
+    roundtrip.add_argument('--seed', type=int, default=0)
+    intern = sub.add_parser('intern', help="instantiating generated models with and without string and Coding interning")
+    intern.add_argument('--models', help="directory of generated models to use instead of a synthetic spec")
+    intern.add_argument('files', nargs='*', help="resource or Bundle JSON files, with --models")
+    intern.add_argument('--repeat', type=int, default=20)
+    intern.add_argument('--profiles', type=int, default=100)
+    intern.add_argument('--elements', type=int, default=30, help="elements per profile")
+    intern.add_argument('--choice', type=float, default=0.1, help="share of value[x] elements")
+    intern.add_argument('--star', type=float, default=0.02, help="share of elements of type *")
+    intern.add_argument('--seed', type=int, default=0)
+    refs = sub.add_parser('references', help="resolving many nested references to a few contained resources")
+    refs.add_argument('--depth', type=int, default=6, help="levels of nesting above the references")
+    refs.add_argument('--references', type=int, default=10000)
+    refs.add_argument('--contained', type=int, default=5, help="contained resources referenced")
+    refs.add_argument('--rounds', type=int, default=5, help="times every reference is resolved")
+    dates = sub.add_parser('dates', help="FHIRDate parsing and formatting over the date strings of the spec's examples")
+    dates.add_argument('--spec', default=os.path.join(generate.cache, 'site'), help="the expanded spec directory")
+    dates.add_argument('--repeat', type=int, default=10)
+    synth = sub.add_parser('synthetic', help="only write a synthetic spec to a directory")
+    synth.add_argument('directory')
+    synth.add_argument('--profiles', type=int, default=100)
+    synth.add_argument('--elements', type=int, default=30, help="elements per profile")
+    synth.add_argument('--choice', type=float, default=0.1, help="share of value[x] elements")
+    synth.add_argument('--star', type=float, default=0.02, help="share of elements of type *")
+    synth.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    generate.loglevel = -1
+    if 'render' == args.benchmark:
+        result = bench_render(args.files, args.properties)
+    elif 'spec' == args.benchmark:
+        result = bench_spec(args.profiles, args.elements, args.choice, args.star, args.jobs, args.seed)
+    elif 'roundtrip' == args.benchmark:
+        if args.models is not None and 0 == len(args.files):
+            parser.error("--models needs resource files")
+        result = bench_roundtrip(args.models, args.files, args.repeat, args.profiles, args.elements, args.choice, args.star, args.seed)
+    elif 'intern' == args.benchmark:
+        if args.models is not None and 0 == len(args.files):
+            parser.error("--models needs resource files")
+        result = bench_intern(args.models, args.files, args.repeat, args.profiles, args.elements, args.choice, args.star, args.seed)
+    elif 'references' == args.benchmark:
+        result = bench_references(args.depth, args.references, args.contained, args.rounds)
+    elif 'dates' == args.benchmark:
+        result = bench_dates(args.spec, args.repeat)
+    elif 'synthetic' == args.benchmark:
+        num = synthetic.write_spec(args.directory, args.profiles, args.elements, args.choice, args.star, seed=args.seed)
+        result = {'directory': args.directory, 'elements_written': num}
+    else:
+        parser.print_help()
+        sys.exit(1)
+    print(json.dumps(result, indent=2, sort_keys=True))
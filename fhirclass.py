@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  Intermediate representation of the classes parsed from FHIR profiles
+
+import bisect
+
+
+class FHIRClass(object):
+    """ A class parsed from a FHIR profile, as handed to the templates.
+    
+    Properties are kept sorted by name while they are added, and can be
+    looked up by name without scanning the property list.
+    """
+    
+    __slots__ = ('path', 'className', 'superclass', 'short', 'formal',
+        'resourceName', 'is_subclass', 'hasNonoptional', 'properties',
+        '_property_names', '_properties_by_name')
+    
+    def __init__(self, path, className, superclass, short=None, formal=None):
+        self.path = path
+        """ The element path that defines the class, like "Patient.contact". """
+        
+        self.className = className
+        self.superclass = superclass
+        self.short = short
+        self.formal = formal
+        
+        self.resourceName = None
+        """ Set if the class describes the profile's resource itself. """
+        
+        self.is_subclass = False
+        self.hasNonoptional = False
+        
+        self.properties = []
+        """ FHIRClassProperty instances, sorted by name. """
+        
+        self._property_names = []
+        self._properties_by_name = {}
+    
+    def add_property(self, prop):
+        """ Inserts the property at its sorted position; properties with the
+        same name keep the order in which they were added.
+        """
+        idx = bisect.bisect_right(self._property_names, prop.name)
+        self._property_names.insert(idx, prop.name)
+        self.properties.insert(idx, prop)
+        self._properties_by_name[prop.name] = prop
+        if prop.nonoptional:
+            self.hasNonoptional = True
+    
+    def property_named(self, name):
+        """ Returns the property with the given name, the last one added if
+        there are several, or `None`.
+        """
+        return self._properties_by_name.get(name)
+    
+    def __repr__(self):
+        return '<FHIRClass {}>'.format(self.className)
+
+
+class FHIRClassProperty(object):
+    """ One property of a FHIRClass.
+    """
+    
+    __slots__ = ('name', 'orig_name', 'short', 'className', 'jsonClass',
+        'isArray', 'isReferenceTo', 'nonoptional', 'isNative', 'isInterned')
+    
+    def __init__(self, name, orig_name, short, className, jsonClass,
+                 isArray=False, isReferenceTo=None, nonoptional=False, isNative=False, isInterned=False):
+        self.name = name
+        """ The property name in the generated class. """
+        
+        self.orig_name = orig_name
+        """ The property name as defined by the profile. """
+        
+        self.short = short
+        self.className = className
+        self.jsonClass = jsonClass
+        self.isArray = isArray
+        self.isReferenceTo = isReferenceTo
+        self.nonoptional = nonoptional
+        self.isNative = isNative
+        
+        self.isInterned = isInterned
+        """ Whether values can be interned, see `interntypes`. """
+    
+    def __repr__(self):
+        return '<FHIRClassProperty {}: {}>'.format(self.name, self.className)
+
+
+class FHIRClassIndex(object):
+    """ All classes of a spec by class name.
+    """
+    
+    def __init__(self, subclassmap=None):
+        self.classes = {}
+        self.subclassmap = subclassmap or {}
+        """ Maps class names to the name of the class describing their
+        properties, like "FHIRReference" to "ResourceReference". """
+    
+    def add(self, klass):
+        """ Adds the class unless there already is one with the same name.
+        
+        :returns: False if a class with the same name was already present
+        """
+        if klass.className in self.classes:
+            return False
+        self.classes[klass.className] = klass
+        return True
+    
+    def get(self, className):
+        return self.classes.get(className)
+    
+    def get_mapped(self, className):
+        """ Returns the class describing the properties of `className`,
+        taking `subclassmap` into account.
+        """
+        return self.classes.get(self.subclassmap.get(className, className))
+    
+    def __contains__(self, className):
+        return className in self.classes
+    
+    def __len__(self):
+        return len(self.classes)
+    
+    def __iter__(self):
+        return iter(self.classes.values())
+
+
+class FHIRProfile(object):
+    """ Everything parsed from one profile: its classes, the classes these
+    need to import and the search parameters the profile supports.
+    """
+    
+    __slots__ = ('name', 'filename', 'classes', 'imports', 'search_params', 'supported')
+    
+    def __init__(self, name, filename, classes, imports, search_params, supported):
+        self.name = name
+        """ The name of the profile's main class, like "Patient". """
+        
+        self.filename = filename
+        self.classes = classes
+        self.imports = imports
+        
+        self.search_params = search_params
+        """ Set of "name|original-name|type" strings. """
+        
+        self.supported = supported
+        """ Set of search parameter names supported by the profile. """
+    
+    def __repr__(self):
+        return '<FHIRProfile {}>'.format(self.name)
@@ -3,6 +3,7 @@
 #
 #  Download and parse FHIR resource definitions
 #  Supply "-f" to force a redownload of the spec
+#  Supply "-j N" to process profiles and unit tests with N worker processes
 
 import io
 import sys
@@ -12,13 +13,27 @@ import glob
 import re
 import json
 import datetime
-from jinja2 import Environment, PackageLoader
+import argparse
+import functools
+import hashlib
+import filecmp
+import pickle
+import time
+import contextlib
+import fnmatch
+import posixpath
+from jinja2 import Environment, PackageLoader, FileSystemBytecodeCache
+from jinja2.bccache import Bucket
 from jinja2.filters import environmentfilter
 
 from settings import *
+from fhirclass import FHIRClass, FHIRClassProperty, FHIRClassIndex, FHIRProfile
 
 
 cache = 'downloads'
+template_cache = os.path.join(cache, 'templates')
+ir_cache = os.path.join(cache, 'ir')
+ir_cache_format = 1             # increase when the parsed representation changes
 loglevel = 0
 
 skip_properties = [
@@ -28,7 +43,28 @@ skip_properties = [
     'contained',
 ]
 
-jinjaenv = Environment(loader=PackageLoader('generate', '.'))
+
+class TemplateBytecodeCache(FileSystemBytecodeCache):
+    """ Persists compiled templates across runs, keyed by the hash of the
+    template source rather than its name, so an edited template never picks
+    up stale bytecode and unchanged templates are never compiled again.
+    """
+    
+    def get_bucket(self, environment, name, filename, source):
+        key = self.get_source_checksum(source)
+        bucket = Bucket(environment, key, key)
+        self.load_bytecode(bucket)
+        return bucket
+    
+    def dump_bytecode(self, bucket):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        super(TemplateBytecodeCache, self).dump_bytecode(bucket)
+
+
+jinjaenv = Environment(loader=PackageLoader('generate', '.'), bytecode_cache=TemplateBytecodeCache(template_cache), auto_reload=False)
+manifest = None
+templates = {}
 
 
 def log0(*logstring):
@@ -40,17 +76,265 @@ def log1(*logstring):
         print(' '.join(str(s) for s in logstring))
 
 
-def download(url, path):
+class Timings(object):
+    """ Records wall time, CPU time and memory allocations of the generator's
+    phases when run with `--profile`; does nothing otherwise.
+    
+    Allocations are tracked with `tracemalloc`: `alloc` is the memory still
+    allocated when a phase ends, `peak` the highest allocation during the
+    phase, both relative to its start.
+    """
+    
+    def __init__(self):
+        self.enabled = False
+        self.records = []
+        self._stack = []
+    
+    def start(self):
+        import tracemalloc
+        self.enabled = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+    
+    @contextlib.contextmanager
+    def measure(self, phase, name=None, group=None):
+        """ Context manager measuring the enclosed code.
+        
+        :param phase: The kind of work, like "parse" or "render"
+        :param name: What is worked on, like the profile's filename
+        :param group: Used to aggregate records, like the template's name
+        """
+        if not self.enabled:
+            yield
+            return
+        
+        import tracemalloc
+        current = tracemalloc.get_traced_memory()[0]
+        frame = {'peak': current}
+        self._stack.append(frame)
+        tracemalloc.reset_peak()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            now, peak = tracemalloc.get_traced_memory()
+            peak = max(frame['peak'], peak)
+            self._stack.pop()
+            if len(self._stack) > 0:        # nested phases reset the peak, hand it up
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+            self.records.append({
+                'phase': phase,
+                'name': name,
+                'group': group,
+                'pid': os.getpid(),
+                'wall': wall,
+                'cpu': cpu,
+                'alloc': now - current,
+                'peak': peak - current,
+            })
+    
+    def summary(self, limit=10):
+        """ Logs totals per phase and the slowest profiles and templates.
+        """
+        phases = {}
+        for rec in self.records:
+            total = phases.setdefault(rec['phase'], {'count': 0, 'wall': 0.0, 'cpu': 0.0, 'alloc': 0, 'peak': 0})
+            total['count'] += 1
+            total['wall'] += rec['wall']
+            total['cpu'] += rec['cpu']
+            total['alloc'] += rec['alloc']
+            total['peak'] = max(total['peak'], rec['peak'])
+        
+        log0('->  Profile (wall, CPU, allocated, peak allocation)')
+        for phase, total in sorted(phases.items(), key=lambda x: -x[1]['wall']):
+            log0('-->  {:<10} {:>5} x {:>8.3f}s {:>8.3f}s {:>9.1f}K {:>9.1f}K'.format(phase, total['count'],
+                total['wall'], total['cpu'], total['alloc'] / 1024, total['peak'] / 1024))
+        
+        slowest = sorted([r for r in self.records if 'parse' == r['phase']], key=lambda x: -x['wall'])[:limit]
+        if len(slowest) > 0:
+            log0('->  Slowest profiles')
+            for rec in slowest:
+                log0('-->  {:<40} {:>8.3f}s {:>9.1f}K'.format(rec['name'], rec['wall'], rec['peak'] / 1024))
+        
+        groups = {}
+        for rec in self.records:
+            if 'render' == rec['phase']:
+                total = groups.setdefault(rec['group'], {'count': 0, 'wall': 0.0, 'slowest': None})
+                total['count'] += 1
+                total['wall'] += rec['wall']
+                if total['slowest'] is None or rec['wall'] > total['slowest']['wall']:
+                    total['slowest'] = rec
+        if len(groups) > 0:
+            log0('->  Slowest templates (total, average, slowest file)')
+            for group, total in sorted(groups.items(), key=lambda x: -x[1]['wall'])[:limit]:
+                log0('-->  {:<40} {:>5} x {:>8.3f}s {:>8.4f}s  {}'.format(group, total['count'], total['wall'],
+                    total['wall'] / total['count'], total['slowest']['name']))
+    
+    def write(self, path):
+        _write_json(path, {'records': self.records})
+
+
+timings = Timings()
+
+
+def _timed_job(func, item):
+    """ Runs `func` in a worker process while recording timings, returning
+    its result together with the worker's records.
+    """
+    timings.start()
+    timings.records = []
+    result = func(item)
+    return result, timings.records
+
+
+download_chunk_size = 1024 * 1024
+
+
+def download(url, path, force=False, checksum=None):
     """ Download the given URL to the given path.
+    
+    The response is streamed to "path.part", which is resumed with an HTTP
+    Range request if a previous download was interrupted; a part the server
+    answers with 416 for being as long as the file already is complete.
+    ETag, Last-Modified and the SHA-256 of the download are kept in
+    "path.meta.json"; an existing file is re-used unless `force` is set, in
+    which case the server is asked whether it changed
+    (If-None-Match/If-Modified-Since).
+    
+    :param checksum: The expected SHA-256 hex digest, if known
+    :returns: True if a new file was downloaded, False if the existing one
+        is still current
     """
+    meta_path = path + '.meta.json'
+    meta = {}
+    if os.path.exists(meta_path):
+        with io.open(meta_path, 'r', encoding='utf-8') as handle:
+            meta = json.load(handle)
+    
+    # verify what we have
+    if os.path.exists(path):
+        known = checksum or meta.get('sha256')
+        if known and known != file_hash(path, hashlib.sha256):
+            log0('xx>  Checksum mismatch for {}, downloading again'.format(path))
+            os.remove(path)
+            meta.pop('etag', None)
+            meta.pop('last_modified', None)
+        elif not force:
+            return False
+    
     import requests     # import here as we can bypass its use with a manual download
     
-    log0('->  Downloading {}'.format(url))
-    ret = requests.get(url)
-    assert(ret.ok)
-    with io.open(path, 'wb') as handle:
-        for chunk in ret.iter_content():
-            handle.write(chunk)
+    headers = {}
+    if os.path.exists(path):
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+    
+    part = path + '.part'
+    partial = meta.get('partial', {})
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    if offset > 0:
+        headers['Range'] = 'bytes={}-'.format(offset)
+        validator = partial.get('etag')
+        if not validator or validator.startswith('W/'):     # If-Range needs a strong validator
+            validator = partial.get('last_modified')
+        if validator:
+            headers['If-Range'] = validator
+    
+    log0('->  Downloading {}{}'.format(url, ' from byte {}'.format(offset) if offset > 0 else ''))
+    ret = requests.get(url, headers=headers, stream=True)
+    try:
+        if 304 == ret.status_code:
+            log0('->  {} has not been modified'.format(url))
+            return False
+        
+        # the part file may already be complete, the server then can't satisfy the range
+        complete = 416 == ret.status_code and offset > 0
+        if complete and 'bytes */{}'.format(offset) != ret.headers.get('Content-Range'):
+            log0('xx>  Cannot resume {}, downloading again'.format(part))
+            os.remove(part)
+            meta.pop('partial', None)
+            _write_json(meta_path, meta)
+            return download(url, path, force, checksum)
+        if not complete and not ret.ok:
+            raise Exception("Failed to download {}: {} {}".format(url, ret.status_code, ret.reason))
+        
+        digest = hashlib.sha256()
+        if complete or (206 == ret.status_code and ret.headers.get('Content-Range', '').startswith('bytes {}-'.format(offset))):
+            with io.open(part, 'rb') as handle:
+                for chunk in iter(lambda: handle.read(download_chunk_size), b''):
+                    digest.update(chunk)
+            mode = 'ab'
+        else:
+            mode = 'wb'
+        
+        if not complete:
+            # remember validators before streaming, so an interrupted download can be resumed
+            meta['partial'] = {
+                'etag': ret.headers.get('ETag'),
+                'last_modified': ret.headers.get('Last-Modified'),
+            }
+            _write_json(meta_path, meta)
+            
+            with io.open(part, mode) as handle:
+                for chunk in ret.iter_content(chunk_size=download_chunk_size):
+                    digest.update(chunk)
+                    handle.write(chunk)
+    finally:
+        ret.close()
+    
+    sha256 = digest.hexdigest()
+    if checksum and checksum != sha256:
+        os.remove(part)
+        meta.pop('partial', None)
+        _write_json(meta_path, meta)
+        raise Exception("Checksum mismatch for {}: expected {} but got {}".format(url, checksum, sha256))
+    
+    os.replace(part, path)
+    partial = meta.get('partial', {})
+    meta = {
+        'url': url,
+        'etag': partial.get('etag'),
+        'last_modified': partial.get('last_modified'),
+        'sha256': sha256,
+    }
+    _write_json(meta_path, meta)
+    return True
+
+
+def cache_version(path):
+    """ Keeps a copy of the downloaded archive named after its FHIR version
+    next to it, e.g. "fhir-spec-0.0.82.zip", which can be used with `-z`.
+    
+    :returns: The path of the versioned archive
+    """
+    import zipfile
+    
+    version = None
+    with zipfile.ZipFile(path) as z:
+        with io.TextIOWrapper(z.open('site/version.info'), encoding='utf-8') as handle:
+            version = read_version(handle)
+    
+    assert(version is not None)
+    base, ext = os.path.splitext(path)
+    target = '{}-{}{}'.format(base, version, ext)
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(path, target)
+    except OSError:
+        shutil.copyfile(path, target)
+    log0('->  Cached FHIR {} as {}'.format(version, target))
+    return target
+
+
+def _write_json(path, js):
+    with io.open(path, 'w', encoding='utf-8') as handle:
+        handle.write(json.dumps(js, sort_keys=True))
 
 
 def expand(path, target):
@@ -64,57 +348,440 @@ def expand(path, target):
         z.extractall(target)
 
 
-def parse(path):
-    """ Parse all JSON profile definitions found in the given expanded
-    directory, create classes for all found profiles, collect all search params
-    and generate the search param extension.
+class SpecDirectory(object):
+    """ Gives access to the files of a spec that has been expanded into a
+    directory. Member names are paths on disk.
     """
-    assert(os.path.exists(path))
     
-    # get FHIR version
+    def __init__(self, path):
+        self.path = path
+    
+    def __str__(self):
+        return self.path
+    
+    def join(self, filename):
+        return os.path.join(self.path, filename)
+    
+    def exists(self, name=None):
+        return os.path.exists(name or self.path)
+    
+    def glob(self, pattern):
+        """ Sorted list of the member names matching the filename pattern.
+        """
+        return sorted(glob.glob(os.path.join(self.path, pattern)))
+    
+    def open(self, name):
+        return io.open(name, 'r', encoding='utf-8')
+    
+    def hash(self, name):
+        return file_hash(name)
+    
+    def materialize(self, name):
+        """ Makes sure the member exists on disk and returns its path.
+        """
+        return name
+
+
+_open_archives = {}
+
+class SpecArchive(object):
+    """ Gives access to the files of a spec right inside its ZIP archive,
+    without extracting it first. Member names are names within the archive,
+    like "site/patient.profile.json".
+    
+    Instances can be sent to worker processes; each process opens the
+    archive once on first use.
+    """
+    
+    def __init__(self, path, prefix='site'):
+        self.path = path
+        self.prefix = prefix
+    
+    def __str__(self):
+        return '{}/{}'.format(self.path, self.prefix)
+    
+    @property
+    def archive(self):
+        key = (os.getpid(), os.path.abspath(self.path))
+        if key not in _open_archives:
+            import zipfile
+            _open_archives[key] = zipfile.ZipFile(self.path)
+        return _open_archives[key]
+    
+    def join(self, filename):
+        return posixpath.join(self.prefix, filename)
+    
+    def exists(self, name=None):
+        if name is None:
+            return os.path.exists(self.path)
+        try:
+            self.archive.getinfo(name)
+            return True
+        except KeyError:
+            return False
+    
+    def glob(self, pattern):
+        """ Sorted list of the member names directly inside `prefix` that
+        match the filename pattern.
+        """
+        names = []
+        for name in self.archive.namelist():
+            directory, filename = posixpath.split(name)
+            if directory == self.prefix and fnmatch.fnmatchcase(filename, pattern):
+                names.append(name)
+        return sorted(names)
+    
+    def open(self, name):
+        return io.TextIOWrapper(self.archive.open(name), encoding='utf-8')
+    
+    def hash(self, name):
+        """ Uses size and CRC-32 from the archive directory, which doesn't
+        need the member to be decompressed.
+        """
+        info = self.archive.getinfo(name)
+        return 'crc32:{:08x}:{}'.format(info.CRC, info.file_size)
+    
+    def materialize(self, name):
+        """ Extracts the member next to the archive, as `expand()` would, if
+        it hasn't been extracted already, and returns its path. Generated unit
+        tests read the examples from there.
+        """
+        target = os.path.dirname(self.path)
+        path = os.path.join(target, *name.split('/'))
+        if not os.path.exists(path):
+            self.archive.extract(name, target)
+        return path
+
+
+def file_hash(path, algorithm=hashlib.sha1):
+    """ Returns the hex digest (SHA-1 by default) of the file's content,
+    `None` if there is no file at the given path.
+    """
+    if not os.path.exists(path):
+        return None
+    digest = algorithm()
+    with io.open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_sources():
+    """ Returns the paths of the files other than the spec itself that
+    influence parsing: the generator's own code, settings, mappings and the
+    IR classes.
+    """
+    sources = [os.path.abspath(__file__)]
+    for name, module in sorted(sys.modules.items()):
+        if name in ('settings', 'fhirclass') or name.endswith('mappings'):
+            if getattr(module, '__file__', None):
+                sources.append(module.__file__)
+    return sources
+
+
+def generator_sources():
+    """ Returns the paths of all files other than the spec itself that
+    influence the generated output: templates, settings, mappings and the
+    generator's own code.
+    """
+    sources = parse_sources()
+    for tpl in [tpl_resource_source, tpl_factory_source, tpl_searchparams_source, tpl_unittest_source]:
+        if os.path.exists(tpl):
+            sources.append(tpl)
+    return sources
+
+
+class Manifest(object):
+    """ Records content hashes of the generator's inputs and outputs next to
+    the generated files.
+    
+    Profiles whose file hash, generator sources and outputs are unchanged
+    since the last run are not rendered again.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.version = None
+        self.date = None
+        self.sources = {}
+        """ Hashes of `generator_sources()`, by path relative to the
+        generator. """
+        
+        self.profiles = {}
+        """ Profile filename -> {'hash': ..., 'outputs': [...]} """
+        
+        self.outputs = {}
+        """ Hashes of all written files, by path. """
+        
+        if path and os.path.exists(path):
+            with io.open(path, 'r', encoding='utf-8') as handle:
+                js = json.load(handle)
+            self.version = js.get('version')
+            self.date = js.get('date')
+            self.sources = js.get('sources', {})
+            self.profiles = js.get('profiles', {})
+            self.outputs = js.get('outputs', {})
+    
+    def prepare(self, version, sources):
+        """ Compares spec version and generator sources to the previous run
+        and forgets all rendered profiles if anything changed.
+        
+        :returns: True if the previous run's outputs are still current
+        """
+        here = os.path.dirname(os.path.abspath(__file__))
+        hashes = {os.path.relpath(os.path.abspath(src), here): file_hash(src) for src in sources}
+        if version == self.version and hashes == self.sources:
+            return True
+        
+        log1('--->  Generator sources or spec version changed, regenerating everything')
+        self.version = version
+        self.date = None
+        self.sources = hashes
+        self.profiles = {}
+        return False
+    
+    def is_current(self, path, digest):
+        """ Returns True if the profile (whose current hash is `digest`) and
+        all the files rendered from it are unchanged since the last run.
+        """
+        entry = self.profiles.get(os.path.basename(path))
+        if entry is None or entry['hash'] != digest:
+            return False
+        for output in entry['outputs']:
+            if self.outputs.get(output) is None or self.outputs[output] != file_hash(output):
+                return False
+        return True
+    
+    def did_render_profile(self, path, digest, outputs):
+        self.profiles[os.path.basename(path)] = {
+            'hash': digest,
+            'outputs': outputs,
+        }
+        for output in outputs:
+            self.record_output(output)
+    
+    def record_output(self, path, content=None):
+        """ Remembers the hash of the given output file, hashing `content`
+        instead of reading the file if it is given.
+        """
+        if content is not None:
+            self.outputs[path] = hashlib.sha1(content.encode('utf-8')).hexdigest()
+        else:
+            self.outputs[path] = file_hash(path)
+    
+    def save(self):
+        if not self.path:
+            return
+        dirpath = os.path.dirname(self.path)
+        if dirpath and not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+        js = {
+            'version': self.version,
+            'date': self.date,
+            'sources': self.sources,
+            'profiles': self.profiles,
+            'outputs': self.outputs,
+        }
+        content = json.dumps(js, sort_keys=True)
+        if os.path.exists(self.path):
+            with io.open(self.path, 'r', encoding='utf-8') as handle:
+                if handle.read() == content:
+                    return
+        with io.open(self.path, 'w', encoding='utf-8') as handle:
+            handle.write(content)
+
+
+def read_version(handle):
+    """ Reads the FHIR version from an open "version.info" file.
+    """
     version = None
-    with io.open(os.path.join(path, 'version.info'), 'r', encoding='utf-8') as handle:
-        text = handle.read()
-        for line in text.split("\n"):
-            if '=' in line:
-                (n, v) = line.split('=', 2)
-                if 'FhirVersion' == n:
-                    version = v
+    for line in handle.read().split("\n"):
+        if '=' in line:
+            (n, v) = line.split('=', 2)
+            if 'FhirVersion' == n:
+                version = v.strip()
+    return version
+
+
+class IRCache(object):
+    """ Binary cache of everything parsed from a spec: the FHIRProfile of
+    every profile and the test data derived from every example. There is one
+    cache file per spec version and hash of the generator, settings and
+    mappings, so a template-only change goes straight from the cache to
+    `render()`.
+    
+    Entries carry the hash of their source file; profiles or examples that
+    changed are parsed again.
+    """
+    
+    def __init__(self, directory, version, sources):
+        digest = hashlib.sha1('ir{}'.format(ir_cache_format).encode('utf-8'))
+        for src in sources:
+            digest.update(file_hash(src).encode('utf-8'))
+        self.path = os.path.join(directory, '{}-{}.pickle'.format(version, digest.hexdigest()[:16])) if directory else None
+        self.profiles = {}
+        """ Profile filename -> (hash, FHIRProfile or None) """
+        
+        self.unittests = {}
+        """ Example filename -> (hash, (class-name, [test-dictionaries])) """
+        
+        self.changed = False
+        
+        if self.path and os.path.exists(self.path):
+            try:
+                with io.open(self.path, 'rb') as handle:
+                    cached = pickle.load(handle)
+                self.profiles = cached['profiles']
+                self.unittests = cached['unittests']
+            except Exception as e:
+                log0('xx>  Ignoring unreadable IR cache {}: {}'.format(self.path, e))
+    
+    def profile(self, path, digest):
+        """ :returns: A tuple (hit, FHIRProfile); the profile may be `None`
+            on a hit, for profiles without structure
+        """
+        entry = self.profiles.get(os.path.basename(path))
+        if entry is not None and entry[0] == digest:
+            return True, entry[1]
+        return False, None
+    
+    def did_parse_profile(self, path, digest, profile):
+        """ Stores a freshly parsed profile; as unit test data depends on all
+        classes, cached unit test data is discarded.
+        """
+        self.profiles[os.path.basename(path)] = (digest, profile)
+        self.unittests = {}
+        self.changed = True
+    
+    def unittest(self, path, digest):
+        entry = self.unittests.get(os.path.basename(path))
+        if entry is not None and entry[0] == digest:
+            return entry[1]
+        return None
+    
+    def did_parse_unittest(self, path, digest, result):
+        self.unittests[os.path.basename(path)] = (digest, result)
+        self.changed = True
+    
+    def save(self):
+        if not self.path or not self.changed:
+            return
+        dirpath = os.path.dirname(self.path)
+        if not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+        tmp = self.path + '.tmp'
+        with io.open(tmp, 'wb') as handle:
+            pickle.dump({'profiles': self.profiles, 'unittests': self.unittests}, handle, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+        self.changed = False
+
+
+def parse_map(func, items, jobs=1, initializer=None, initargs=()):
+    """ Apply `func` to all items, in a pool of `jobs` worker processes if
+    more than one job is requested.
+    
+    :returns: A list of results, in the same order as `items`
+    """
+    if jobs > 1 and len(items) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        chunksize = max(1, len(items) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs, initializer=initializer, initargs=initargs) as pool:
+            if not timings.enabled:
+                return list(pool.map(func, items, chunksize=chunksize))
+            
+            results = []
+            for result, records in pool.map(functools.partial(_timed_job, func), items, chunksize=chunksize):
+                results.append(result)
+                timings.records.extend(records)
+            return results
+    
+    if initializer is not None:
+        initializer(*initargs)
+    return [func(item) for item in items]
+
+
+def parse(spec, jobs=1, only=None):
+    """ Parse all JSON profile definitions found in the given spec, create
+    classes for all found profiles, collect all search params and generate
+    the search param extension.
+    
+    :param spec: A `SpecDirectory` or `SpecArchive` instance, or the path of
+        the directory containing the expanded spec
+    :param jobs: The number of worker processes to use for profiles and unit
+        tests; results are merged in file name order, so the output does not
+        depend on the number of jobs
+    :param only: A list of class names; if given, only the profiles defining
+        these classes and the classes they depend on are processed
+    """
+    if not isinstance(spec, (SpecDirectory, SpecArchive)):
+        spec = SpecDirectory(spec)
+    assert(spec.exists())
+    
+    # get FHIR version
+    with spec.open(spec.join('version.info')) as handle:
+        version = read_version(handle)
     
     assert(version is not None)
     log0("->  This is FHIR version {}".format(version))
-    now = datetime.date.today()
+    
+    # re-use the previous run's date if nothing but the spec's profiles changed, so unchanged files stay unchanged
+    global manifest
+    manifest = Manifest(manifest_target)
+    if not manifest.prepare(version, generator_sources()) or not manifest.date:
+        manifest.date = datetime.date.today().isoformat()
     info = {
-        'version': version.strip() if version else 'X',
-        'date': now.isoformat(),
-        'year': now.year
+        'version': version,
+        'date': manifest.date,
+        'year': int(manifest.date[:4]),
+        'lowercase_import_hack': ptrn_filenames_lowercase,
+        'slots': resource_slots,
     }
     
-    # parse profiles
-    all_classes = {}
+    # parse profiles not in the IR cache, render those changed since the last run
+    ir = IRCache(ir_cache, version, parse_sources())
+    all_classes = FHIRClassIndex(subclassmap)
     factories = set()
     search_params = set()
     in_profiles = {}
-    for prof in glob.glob(os.path.join(path, '*.profile.json')):
-        profile_name, classes, srch_prms, supp_profs = process_profile(prof, info)
-        
-        if profile_name is not None:
-            factories.add(profile_name)
-            for klass in classes:
-                cn = klass.get('className')
-                assert(cn is not None)
-                if cn in all_classes:
-                    log1("xxx>  Already have class {}".format(cn))
-                else:
-                    all_classes[cn] = klass
+    profiles = spec.glob('*.profile.json')
+    if only is not None:
+        profiles = profile_closure(spec, profiles, list(only) + resource_baseclass_profiles, ir)
+        log0('->  Selected {} profiles: {}'.format(len(profiles), ', '.join(profile_name(p) for p in profiles)))
+    items = []
+    for prof in profiles:
+        digest = spec.hash(prof)
+        hit, profile = ir.profile(prof, digest)
+        needs_render = write_resources and not manifest.is_current(prof, digest)
+        items.append((prof, digest, hit, profile, needs_render))
+    
+    todo = [item for item in items if not item[2] or item[4]]
+    if write_resources and len(todo) > 0:
+        load_template(tpl_resource_source)      # compile before forking, workers inherit it
+    log0('->  Parsing {} of {} profiles, rendering {}'.format(len([i for i in items if not i[2]]), len(items), len([i for i in items if i[4]])))
+    parsed = parse_map(functools.partial(_process_profile_job, info=info, spec=spec), todo, jobs)
+    results = dict(zip([item[0] for item in todo], parsed))
+    
+    for prof, digest, hit, profile, needs_render in items:
+        profile = results.get(prof, profile)
+        if not hit:
+            ir.did_parse_profile(prof, digest, profile)
+        if needs_render:
+            manifest.did_render_profile(prof, digest, [resource_target(profile.name)] if profile is not None else [])
+        if profile is None:
+            continue
         
-        if srch_prms is not None:
-            search_params |= srch_prms
-            for spp in supp_profs:
-                if spp in in_profiles:
-                    in_profiles[spp].add(profile_name)
-                else:
-                    in_profiles[spp] = set([profile_name])
+        factories.add(profile.name)
+        for klass in profile.classes:
+            assert(klass.className is not None)
+            if not all_classes.add(klass):
+                log1("xxx>  Already have class {}".format(klass.className))
+        
+        search_params |= profile.search_params
+        for spp in profile.supported:
+            if spp in in_profiles:
+                in_profiles[spp].add(profile.name)
+            else:
+                in_profiles[spp] = set([profile.name])
     
     # write base classes
     if write_resources and len(all_classes) > 0:
@@ -122,30 +789,123 @@ def parse(path):
             if os.path.exists(base):
                 tgt = os.path.join(resource_base_target, os.path.basename(base))
                 log0("-->  Copying base class {} to {}".format(os.path.basename(base), tgt))
-                shutil.copyfile(base, tgt)
-    
-    # process element factory
-    process_factories(factories, info)
+                copyfile(base, tgt)
     
-    # process search parameters
-    process_search(search_params, in_profiles, info)
+    # process element factory and search parameters; those of a subset would drop the other classes of an earlier run
+    if only is not None and os.path.exists(tpl_factory_target):
+        log0('-->  Keeping {}, generated for all profiles'.format(tpl_factory_target))
+    else:
+        process_factories(factories, info)
+    if only is not None and os.path.exists(tpl_searchparams_target):
+        log0('-->  Keeping {}, generated for all profiles'.format(tpl_searchparams_target))
+    else:
+        process_search(search_params, in_profiles, info)
     
     # detect and process unit tests
-    process_unittests(path, all_classes, info)
+    process_unittests(spec, all_classes, info, jobs, ir, factories if only is not None else None)
+    
+    ir.save()
+    manifest.save()
+
+
+def _process_profile_job(item, info, spec):
+    """ Parses the profile described by an item created in `parse()`, unless
+    it came from the IR cache, and renders it if needed.
+    """
+    path, digest, hit, profile, needs_render = item
+    if not hit:
+        with timings.measure('parse', os.path.basename(path)):
+            profile = parse_profile(path, spec)
+    if needs_render and profile is not None:
+        render_profile(profile, info)
+    return profile
+
+
+def profile_name(path):
+    """ The lowercase name of the profile at `path`, like "patient" for
+    "patient.profile.json".
+    """
+    return os.path.basename(path).split('.')[0].lower()
+
+
+def profile_closure(spec, profiles, names, ir):
+    """ Selects the profiles defining the given class names and, transitively,
+    those defining their superclasses, property classes and referenced
+    resources. Profiles are parsed as needed; results go to the IRCache `ir`
+    so `parse()` does not parse them again.
+    
+    :param profiles: All profile paths of `spec`
+    :param names: Class names like "Patient"
+    :returns: The selected profile paths, in the order of `profiles`
+    """
+    by_name = {profile_name(prof): prof for prof in profiles}
+    selected = set()
+    seen = set()
+    todo = [(name, True) for name in names]
+    while len(todo) > 0:
+        name, requested = todo.pop()
+        name = subclassmap.get(name, name)
+        if name in seen:
+            continue
+        seen.add(name)
+        
+        prof = by_name.get(name.lower())
+        if prof is None:
+            if requested:
+                log0('xx>  There is no profile for "{}"'.format(name))
+            continue                # base classes and classes defined inline by other profiles
+        selected.add(prof)
+        
+        digest = spec.hash(prof)
+        hit, profile = ir.profile(prof, digest)
+        if not hit:
+            with timings.measure('parse', os.path.basename(prof)):
+                profile = parse_profile(prof, spec)
+            ir.did_parse_profile(prof, digest, profile)
+        if profile is not None:
+            todo.extend((imp, False) for imp in profile.imports)
+    
+    return [prof for prof in profiles if prof in selected]
 
 
-def process_profile(path, info):
+def process_profile(path, info, spec=None):
     """ Parse one profile file, render the class and return possible search
-    parameters.
+    parameters. The passed-in `info` dictionary is not modified, hence
+    profiles can be processed in any order and in separate processes.
     
-    :returns: A tuple with (profile-name, [found classes], "name|original-name|type", search-
-        param-list)
+    :param path: The profile's member name in `spec`, or its path on disk
+    :param spec: The `SpecDirectory` or `SpecArchive` to read from
+    :returns: A FHIRProfile, `None` if the profile has no structure
     """
-    assert(os.path.exists(path))
+    with timings.measure('parse', os.path.basename(path)):
+        profile = parse_profile(path, spec)
+    if profile is not None and write_resources:
+        render_profile(profile, info)
+    return profile
+
+
+def render_profile(profile, info):
+    """ Renders the classes of a parsed profile.
+    """
+    interned = any(prop.isInterned for klass in profile.classes for prop in klass.properties)
+    info = dict(info, filename=profile.filename, main=profile.name, imports=profile.imports, interned=interned)
+    render({'info': info, 'classes': profile.classes}, tpl_resource_source, resource_target(profile.name))
+
+
+def parse_profile(path, spec=None):
+    """ Parse one profile file into a FHIRProfile with the classes, imports
+    and search parameters it defines.
+    
+    :param path: The profile's member name in `spec`, or its path on disk
+    :param spec: The `SpecDirectory` or `SpecArchive` to read from
+    :returns: A FHIRProfile, `None` if the profile has no structure
+    """
+    spec = spec or SpecDirectory(os.path.dirname(path))
+    assert(spec.exists(path))
     
     # read the profile
     profile = None
-    with io.open(path, 'r', encoding='utf-8') as handle:
+    with spec.open(path) as handle:
         profile = json.load(handle)
     
     assert(profile != None)
@@ -154,9 +914,9 @@ def process_profile(path, info):
     structure_arr = profile.get('structure')
     if structure_arr is None or 0 == len(structure_arr):
         log0('xx>  Profile {} has no structure'.format(path))
-        return None, None, None, None
+        return None
     
-    info['filename'] = filename = os.path.basename(path)
+    filename = os.path.basename(path)
     requirements = profile.get('requirements')
     structure = structure_arr[0]
     
@@ -178,7 +938,6 @@ def process_profile(path, info):
         main = superclass
     elif main != superclass:
         is_subclass = True
-    info['main'] = main
     
     log0('-->  Parsing profile {}  --  {}'.format(main, filename))
     classes = []
@@ -210,22 +969,22 @@ def process_profile(path, info):
         
         # element describes a new class
         if newklass is not None:
-            mapping[newklass['path']] = newklass
+            mapping[newklass.path] = newklass
             classes.append(newklass)
             
             # is this the resource description itself?
             if elem_path == main:
-                newklass['resourceName'] = main
-                newklass['formal'] = requirements
+                newklass.resourceName = main
+                newklass.formal = requirements
             
             # this is a "subclass", such as "Age" on "Quantity"
             elif is_subclass:
                 log1('--->  Treating {} as subclass of {}'.format(main, superclass))
-                newklass['className'] = main
-                newklass['superclass'] = superclass
-                newklass['is_subclass'] = True
-                newklass['short'] = profile.get('name')
-                newklass['formal'] = profile.get('description')
+                newklass.className = main
+                newklass.superclass = superclass
+                newklass.is_subclass = True
+                newklass.short = profile.get('name')
+                newklass.formal = profile.get('description')
                 break
     
     # determine imported classes
@@ -233,35 +992,28 @@ def process_profile(path, info):
     names = set()
     imports = []
     for klass in classes:
-        inline.add(klass['className'])
+        inline.add(klass.className)
     
     for klass in classes:
-        sup = klass.get('superclass')
+        sup = klass.superclass
         if sup is not None and sup not in names:
             names.add(sup)
             if sup not in natives and sup not in inline:
                 imports.append(sup)
         
-        for prop in klass['properties']:
-            name = prop['className']
+        for prop in klass.properties:
+            name = prop.className
             if name not in names:
                 names.add(name)
                 if name not in natives and name not in inline:
                     imports.append(name)
             
-            refTo = prop.get('isReferenceTo')
+            refTo = prop.isReferenceTo
             if refTo is not None and refTo not in names:
                 names.add(refTo)
                 if refTo not in natives and refTo not in inline:
                     imports.append(refTo)
     
-    info['imports'] = sorted(imports)
-    info['lowercase_import_hack'] = ptrn_filenames_lowercase
-    
-    if write_resources:
-        ptrn = main.lower() if ptrn_filenames_lowercase else main
-        render({'info': info, 'classes': classes}, tpl_resource_source, tpl_resource_target_ptrn.format(ptrn))
-    
     # get search params
     search_params = set()
     supported = set()
@@ -281,12 +1033,20 @@ def process_profile(path, info):
             search_params.add('{}|{}|{}'.format(name, orig, tp))
             supported.add(name)
     
-    return main, classes, search_params, supported
+    return FHIRProfile(main, filename, classes, sorted(imports), search_params, supported)
+
+
+def resource_target(main):
+    """ The path of the file the class(es) of the profile named `main` are
+    written to.
+    """
+    ptrn = main.lower() if ptrn_filenames_lowercase else main
+    return tpl_resource_target_ptrn.format(ptrn)
 
 
 def parse_elem(path, name, definition, klass):
     """ Parse one profile element (which will become a class property).
-    A `klass` dictionary may be passed in, in which case the element's
+    A `klass` FHIRClass may be passed in, in which case the element's
     definitions will be interpreted in its context. A new class may be returned
     if an inline defined subtype is detected.
     
@@ -294,8 +1054,8 @@ def parse_elem(path, name, definition, klass):
     :param name: The name of the property, like "identifier"
     :param definition: The element's definition
     :param klass: The owning class of the element, if it has just been parsed
-    :returns: A dictionary with class attributes, if and only if an inline-
-        defined subtype is detected
+    :returns: A FHIRClass instance, if and only if an inline-defined subtype
+        is detected
     """
     short = definition['short']
     formal = definition['formal']
@@ -317,32 +1077,22 @@ def parse_elem(path, name, definition, klass):
     newklass = None
     if klass is None or 0 == len(types):
         className = ''.join(['{}{}'.format(s[:1].upper(), s[1:]) for s in path.split('.')])
-        newklass = {
-            'path': path,
-            'className': className,
-            'superclass': classmap.get(types[0][0], resource_default_base) if len(types) > 0 else resource_default_base,
-            'short': short,
-            'formal': formal,
-            'properties': [],
-            'hasNonoptional': False,
-        }
+        superclass = classmap.get(types[0][0], resource_default_base) if len(types) > 0 else resource_default_base
+        newklass = FHIRClass(path, className, superclass, short, formal)
         
         if 0 == len(types):
             types.append((className, None))
     
-    # add as properties to class
+    # add as properties to class, which keeps them sorted by name
     if klass is not None:
         for tp, ref in types:
             process_elem_type(klass, name, tp, ref, short, formal, n_min, n_max)
-        
-        # sort properties by name
-        if len(klass['properties']) > 0:
-            klass['properties'] = sorted(klass['properties'], key=lambda x: x['name'])
     
     return newklass
 
 def process_elem_type(klass, name, tp, ref, short, formal, n_min, n_max):
-    """ Handle one element (property) type and return a dict describing the property.
+    """ Handle one element (property) type and add a FHIRClassProperty
+    describing it to the class.
     """
     
     # The wildcard type, expand to all possible types, as defined in our mapping
@@ -365,21 +1115,19 @@ def process_elem_type(klass, name, tp, ref, short, formal, n_min, n_max):
     
     # describe the property
     mappedClass = classmap.get(tp, tp)
-    prop = {
-        'name': reservedmap.get(name, name),
-        'orig_name': name,
-        'short': short,
-        'className': mappedClass,
-        'jsonClass': jsonmap.get(mappedClass, jsonmap_default),
-        'isArray': True if '*' == n_max else False,
-        'isReferenceTo': ref,
-        'nonoptional': 0 != int(n_min),
-        'isNative': True if mappedClass in natives else False,
-    }
-    
-    klass['properties'].append(prop)
-    if prop['nonoptional']:
-        klass['hasNonoptional'] = True
+    prop = FHIRClassProperty(
+        name=reservedmap.get(name, name),
+        orig_name=name,
+        short=short,
+        className=mappedClass,
+        jsonClass=jsonmap.get(mappedClass, jsonmap_default),
+        isArray=True if '*' == n_max else False,
+        isReferenceTo=ref,
+        nonoptional=0 != int(n_min),
+        isNative=True if mappedClass in natives else False,
+        isInterned=tp in interntypes,
+    )
+    klass.add_property(prop)
 
 
 def process_factories(factories, info):
@@ -424,16 +1172,34 @@ def process_search(params, in_profiles, info):
     render(data, tpl_searchparams_source, tpl_searchparams_target)
 
 
-def process_unittests(path, classes, info):
+def process_unittests(spec, classes, info, jobs=1, ir=None, only=None):
     """ Finds all example JSON files and uses them for unit test generation.
     Test files use the template `tpl_unittest_source` and dump it according to
-    `tpl_unittest_target_ptrn`.
+    `tpl_unittest_target_ptrn`. Test data found in the IRCache `ir` is used
+    instead of parsing the example again. If `only` is given, only examples
+    of the profiles with these names are used.
     """
     all_tests = {}
-    for utest in glob.glob(os.path.join(path, '*-example*.json')):
-        log0('-->  Parsing unit test {}'.format(os.path.basename(utest)))
-        class_name, tests = process_unittest(utest, classes)
+    with timings.measure('unittests', 'discovery'):
+        utests = spec.glob('*-example*.json')
+        if only is not None:
+            names = set(name.lower() for name in only)
+            utests = [utest for utest in utests if os.path.basename(utest).split('-example')[0].lower() in names]
+        digests = {utest: spec.hash(utest) for utest in utests} if ir is not None else {}
+        results = {utest: ir.unittest(utest, digests[utest]) for utest in utests} if ir is not None else {}
+        todo = [utest for utest in utests if results.get(utest) is None]
+        parsed = parse_map(_process_unittest_job, todo, jobs, _set_unittest_context, (spec, classes))
+    for utest, result in zip(todo, parsed):
+        results[utest] = result
+        if ir is not None:
+            ir.did_parse_unittest(utest, digests[utest], result)
+    
+    for utest in utests:
+        class_name, tests = results[utest]
         if class_name is not None:
+            if write_unittests:
+                spec.materialize(utest)     # generated tests read the example file
+            
             test = {
                 'filename': os.path.join(unittest_filename_prefix, os.path.basename(utest)),
                 'tests': tests,
@@ -445,9 +1211,9 @@ def process_unittests(path, classes, info):
                 all_tests[class_name] = [test]
     
     if write_unittests:
-        for klass, tests in all_tests.items():
+        for klass, tests in sorted(all_tests.items()):
             data = {
-                'info': info,
+                'info': dict(info, filename=', '.join(os.path.basename(t['filename']) for t in tests)),
                 'class': klass,
                 'tests': tests,
             }
@@ -460,20 +1226,37 @@ def process_unittests(path, classes, info):
                 if os.path.exists(utfile):
                     tgt = os.path.join(unittest_copyfiles_base, os.path.basename(utfile))
                     log0("-->  Copying unittest file {} to {}".format(os.path.basename(utfile), tgt))
-                    shutil.copyfile(utfile, tgt)
+                    copyfile(utfile, tgt)
     else:
         log1('oo>  Not writing unit tests')
 
 
-def process_unittest(path, classes):
+_unittest_context = (None, None)
+
+def _set_unittest_context(spec, classes):
+    global _unittest_context
+    _unittest_context = (spec, classes)
+
+def _process_unittest_job(path):
+    """ Runs `process_unittest()` against the spec and classes that were
+    handed to the worker via `_set_unittest_context()`.
+    """
+    log0('-->  Parsing unit test {}'.format(os.path.basename(path)))
+    spec, classes = _unittest_context
+    with timings.measure('unittest', os.path.basename(path)):
+        return process_unittest(path, classes, spec)
+
+
+def process_unittest(path, classes, spec=None):
     """ Process a unit test file at the given path, determining class structure
-    from the given classes dict.
+    from the given FHIRClassIndex.
     
     :returns: A tuple with (top-class-name, [test-dictionaries])
     """
+    spec = spec or SpecDirectory(os.path.dirname(path))
     utest = None
-    assert(os.path.exists(path))
-    with io.open(path, 'r', encoding='utf-8') as handle:
+    assert(spec.exists(path))
+    with spec.open(path) as handle:
         utest = json.load(handle)
     assert(utest != None)
     
@@ -500,18 +1283,14 @@ def process_unittest_properties(utest, klass, classes, prefix=None):
     """
     assert(klass != None)
     
-    props = {}
-    for cp in klass.get('properties', []):      # could cache this, but... lazy
-        props[cp['name']] = cp
-    
     # loop item's properties
     tests = []
     for key, val in utest.items():
-        prop = props.get(key)
+        prop = klass.property_named(key)
         if prop is None:
-            log1('xxx>  Unknown property "{}" in unit test on {}'.format(key, klass.get('className')))
+            log1('xxx>  Unknown property "{}" in unit test on {}'.format(key, klass.className))
         else:
-            propClass = prop['className']
+            propClass = prop.className
             path = unittest_format_path_key.format(prefix, key) if prefix else key
             
             # property is an array
@@ -535,7 +1314,7 @@ def handle_unittest_property(path, value, klass, classes):
     
     # property is another element, recurse
     if dict == type(value):
-        subklass = classes.get(subclassmap[klass] if klass in subclassmap else klass)
+        subklass = classes.get_mapped(klass)
         if subklass is None:
             log1('xxx>  No class {} found for "{}"'.format(klass, path))
         else:
@@ -544,7 +1323,7 @@ def handle_unittest_property(path, value, klass, classes):
         isstr = isinstance(value, str)
         if not isstr and sys.version_info[0] < 3:       # Python 2.x has 'str' and 'unicode'
             isstr = isinstance(value, basestring)
-            
+        
         tests.append({'path': path, 'class': klass, 'value': value.replace("\n", "\\n") if isstr else value})
     
     return tests
@@ -554,20 +1333,54 @@ def render(data, template, filepath):
     """ Render the given class data using the given Jinja2 template, writing
     the output into 'Models'.
     """
-    assert(os.path.exists(template))
-    template = jinjaenv.get_template(template)
-    
-    if not filepath:
-        raise Exception("No target filepath provided")
-    dirpath = os.path.dirname(filepath)
-    if not os.path.isdir(dirpath):
-        os.makedirs(dirpath)
-    
-    with io.open(filepath, 'w', encoding='utf-8') as handle:
-        log0('-->  Writing {}'.format(filepath))
+    with timings.measure('render', filepath, template):
+        template = load_template(template)
+        
+        if not filepath:
+            raise Exception("No target filepath provided")
+        dirpath = os.path.dirname(filepath)
+        if not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+        
         rendered = template.render(data)
-        handle.write(rendered)
-        # handle.write(rendered.encode('utf-8'))
+        if manifest is not None:
+            manifest.record_output(filepath, rendered)
+        
+        # leave identical files untouched so their mtime doesn't change
+        if os.path.exists(filepath):
+            with io.open(filepath, 'r', encoding='utf-8') as handle:
+                if handle.read() == rendered:
+                    log1('-->  Unchanged {}'.format(filepath))
+                    return
+        
+        with io.open(filepath, 'w', encoding='utf-8') as handle:
+            log0('-->  Writing {}'.format(filepath))
+            handle.write(rendered)
+            # handle.write(rendered.encode('utf-8'))
+
+
+def load_template(name):
+    """ Returns the compiled template, compiling (or loading from the
+    bytecode cache) every template only once per process.
+    """
+    template = templates.get(name)
+    if template is None:
+        assert(os.path.exists(name))
+        template = templates[name] = jinjaenv.get_template(name)
+    return template
+
+
+def copyfile(src, tgt):
+    """ Copies the file at `src` to `tgt` unless `tgt` already has identical
+    content.
+    """
+    with timings.measure('copy', tgt):
+        if os.path.exists(tgt) and filecmp.cmp(src, tgt, shallow=False):
+            log1('-->  Unchanged {}'.format(tgt))
+        else:
+            shutil.copyfile(src, tgt)
+    if manifest is not None:
+        manifest.record_output(tgt)
 
 
 def _camelCase(string, splitter='_'):
@@ -622,24 +1435,63 @@ jinjaenv.filters['wordwrap'] = do_wordwrap
 
 
 if '__main__' == __name__:
+    parser = argparse.ArgumentParser(description="Download and parse FHIR resource definitions")
+    parser.add_argument('-f', dest='force', action='store_true', help="re-download the spec if it changed on the server")
+    parser.add_argument('-j', dest='jobs', type=int, default=1, metavar='N', help="process profiles and unit tests with N worker processes")
+    parser.add_argument('--profile', nargs='?', const=True, default=None, metavar='REPORT', help="log where the time goes; also write all measurements to the given JSON file")
+    parser.add_argument('--pstats', metavar='FILE', help="write a cProfile/pstats dump of the main process to FILE")
+    parser.add_argument('--only', type=lambda s: [n.strip() for n in s.split(',') if n.strip()], metavar='CLASSES', help="only generate the comma-separated classes, like \"Patient,Observation\", and the classes they depend on")
+    parser.add_argument('-z', '--zip', nargs='?', const=True, default=None, metavar='ARCHIVE', help="read the spec straight from the downloaded ZIP archive, or the given one, instead of extracting it")
+    args = parser.parse_args()
     
-    # start from scratch?
-    if len(sys.argv) > 1 and '-f' == sys.argv[1]:
-        if os.path.isdir(cache):
-            shutil.rmtree(cache)
-    else:
-        log0('->  Using cached FHIR spec, supply "-f" to re-download')
+    if args.profile is not None:
+        timings.start()
+    if args.pstats:
+        import cProfile
+        pstats_profile = cProfile.Profile()
+        pstats_profile.enable()
     
     # download spec if needed and extract
     path_spec = os.path.join(cache, os.path.split(specification_url)[1])
     expanded_spec = os.path.dirname(path_spec)
-
-    if not os.path.exists(path_spec):
+    
+    if args.zip is not None and True != args.zip:
+        spec = SpecArchive(args.zip)
+    else:
         if not os.path.isdir(cache):
             os.mkdir(cache)
-        download(specification_url, path_spec)
-        expand(path_spec, expanded_spec)
-
+        downloaded = False
+        if args.force or not os.path.exists(path_spec):
+            with timings.measure('download', specification_url):
+                downloaded = download(specification_url, path_spec, args.force, specification_sha256)
+            if downloaded:
+                cache_version(path_spec)
+        else:
+            log0('->  Using cached FHIR spec, supply "-f" to re-download')
+        
+        path_site = os.path.join(expanded_spec, 'site')
+        if downloaded and os.path.isdir(path_site):
+            shutil.rmtree(path_site)
+        
+        if args.zip is not None:
+            spec = SpecArchive(path_spec)
+        else:
+            spec = SpecDirectory(path_site)
+            if not spec.exists(spec.join('version.info')):     # "-z" extracts just the examples into the same directory
+                with timings.measure('extract', path_spec):
+                    expand(path_spec, expanded_spec)
+    
     # parse
-    parse(os.path.join(expanded_spec, 'site'))
+    with timings.measure('total'):
+        parse(spec, max(1, args.jobs), args.only)
+    
+    if args.pstats:
+        pstats_profile.disable()
+        pstats_profile.dump_stats(args.pstats)
+        log0('->  Wrote pstats dump to {}'.format(args.pstats))
+    if args.profile is not None:
+        timings.summary()
+        if True != args.profile:
+            timings.write(args.profile)
+            log0('->  Wrote profile report to {}'.format(args.profile))
 
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  Synthetic specs, and models generated from them, for the benchmarks and
+#  the tests
+
+import io
+import os
+import sys
+import json
+import random
+
+import generate
+
+
+datatype_names = ['string', 'code', 'uri', 'boolean', 'integer', 'decimal', 'date', 'dateTime',
+    'CodeableConcept', 'Coding', 'Period', 'Quantity', 'ResourceReference']
+
+datatypes = {
+    'Coding': [('system', 'uri'), ('code', 'code'), ('display', 'string')],
+    'CodeableConcept': [('coding', 'Coding', '*'), ('text', 'string')],
+    'Period': [('start', 'dateTime'), ('end', 'dateTime')],
+    'Quantity': [('value', 'decimal'), ('unit', 'string'), ('system', 'uri'), ('code', 'code')],
+    'ResourceReference': [('reference', 'string'), ('display', 'string')],
+    'Extension': [('url', 'uri')],
+}
+
+values = {
+    'string': 'Some text',
+    'code': 'final',
+    'uri': 'http://loinc.org',
+    'boolean': True,
+    'integer': 42,
+    'decimal': 7.5,
+    'date': '2014-05-01',
+    'dateTime': '2014-05-01T10:30:00Z',
+    'Coding': {'system': 'http://loinc.org', 'code': '8867-4', 'display': 'Heart rate'},
+    'CodeableConcept': {'coding': [{'system': 'http://loinc.org', 'code': '8867-4', 'display': 'Heart rate'}], 'text': 'Heart rate'},
+}
+
+
+def element(path, tps, n_max='1', profile=None):
+    """ A profile's element definition.
+    
+    :param str path: The element path, like "Patient.name"
+    :param tps: A list of type codes, `None` for an inline-defined class
+    :param str n_max: The maximum cardinality, "1" or "*"
+    :param str profile: The resource a "ResourceReference" element refers to
+    """
+    definition = {
+        'short': 'The {} element'.format(path),
+        'formal': 'Formal definition of {}.'.format(path),
+        'min': 0,
+        'max': n_max,
+    }
+    if tps is not None:
+        definition['type'] = []
+        for tp in tps:
+            js = {'code': tp}
+            if 'ResourceReference' == tp and profile is not None:
+                js['profile'] = 'http://hl7.org/fhir/profiles/{}'.format(profile)
+            definition['type'].append(js)
+    return {'path': path, 'definition': definition}
+
+
+def write_profile(directory, name, base, elements, search_params):
+    """ Writes the profile of the class `name`, a subclass of `base`, with
+    the given `element()` definitions to "{name}.profile.json".
+    """
+    profile = {
+        'resourceType': 'Profile',
+        'name': name,
+        'requirements': 'Synthetic {} for benchmarking.'.format(name),
+        'structure': [{
+            'type': name,
+            'name': name,
+            'snapshot': {'element': [element(name, [base])] + elements},
+            'searchParam': search_params,
+        }],
+    }
+    with io.open(os.path.join(directory, '{}.profile.json'.format(name.lower())), 'w', encoding='utf-8') as handle:
+        handle.write(json.dumps(profile))
+
+
+def write_spec(directory, num_profiles=100, num_elements=30, choice_share=0.1, star_share=0.02, examples=True, seed=0):
+    """ Writes a spec that looks like an expanded FHIR spec to the given
+    directory: a "version.info", the profiles of the data types used and
+    `num_profiles` resource profiles with `num_elements` elements each.
+    
+    :param choice_share: Share of elements that are "value[x]" choices of
+        several types
+    :param star_share: Share of elements of the "*" wildcard type
+    :param examples: Whether to write an example file per resource
+    :returns: The number of elements written
+    """
+    rnd = random.Random(seed)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with io.open(os.path.join(directory, 'version.info'), 'w', encoding='utf-8') as handle:
+        handle.write('[FHIR]\nFhirVersion=0.0.0.synthetic\n')
+    
+    # data types, including all that "*" expands to
+    all_datatypes = dict(datatypes)
+    for tp in generate.starexpandtypes:
+        if tp[:1].isupper() and tp not in all_datatypes and 'Resource' != tp:
+            all_datatypes[tp] = [('text', 'string')]
+    for name, props in sorted(all_datatypes.items()):
+        elements = [element('{}.{}'.format(name, p[0]), [p[1]], p[2] if len(p) > 2 else '1') for p in props]
+        write_profile(directory, name, 'Structure', elements, [])
+    
+    count = 0
+    for i in range(num_profiles):
+        name = 'Synthetic{}'.format(i)
+        elements = []
+        example = {'resourceType': name}
+        for j in range(num_elements):
+            roll = rnd.random()
+            if roll < star_share:
+                elements.append(element('{}.any{}[x]'.format(name, j), ['*']))
+                example['any{}String'.format(j)] = values['string']
+            elif roll < star_share + choice_share:
+                tps = rnd.sample(['string', 'boolean', 'dateTime', 'CodeableConcept', 'Quantity'], 3)
+                elements.append(element('{}.value{}[x]'.format(name, j), tps))
+                if tps[0] in values:
+                    example['value{}{}{}'.format(j, tps[0][:1].upper(), tps[0][1:])] = values[tps[0]]
+            elif 0 == j % 10:
+                # an inline-defined class with two properties
+                elements.append(element('{}.part{}'.format(name, j), None, '*'))
+                elements.append(element('{}.part{}.code'.format(name, j), ['code']))
+                elements.append(element('{}.part{}.date'.format(name, j), ['date']))
+                example['part{}'.format(j)] = [{'code': 'a', 'date': '2014'}, {'code': 'b'}]
+                count += 2
+            else:
+                tp = rnd.choice(datatype_names)
+                n_max = rnd.choice(['1', '1', '*'])
+                elements.append(element('{}.prop{}'.format(name, j), [tp], n_max, 'Synthetic{}'.format(rnd.randrange(num_profiles))))
+                if tp in values:
+                    value = values[tp]
+                    example['prop{}'.format(j)] = [value] if '*' == n_max else value
+            count += 1
+        
+        params = [{'name': 'param-{}'.format(k), 'type': rnd.choice(['string', 'token', 'date', 'reference']), 'documentation': ''} for k in range(5)]
+        write_profile(directory, name, 'Resource', elements, params)
+        if examples:
+            with io.open(os.path.join(directory, '{}-example.json'.format(name.lower())), 'w', encoding='utf-8') as handle:
+                handle.write(json.dumps(example))
+    return count
+
+
+def redirect_output(directory):
+    """ Points all of the generator's targets into the given directory and
+    disables the manifest and the IR cache.
+    """
+    generate.tpl_resource_target_ptrn = os.path.join(directory, '{}.py')
+    generate.resource_base_target = directory
+    generate.tpl_factory_target = os.path.join(directory, os.path.basename(generate.tpl_factory_target))
+    generate.tpl_searchparams_target = os.path.join(directory, 'fhirsearchelement.py')
+    generate.tpl_unittest_target_ptrn = os.path.join(directory, '{}_tests.py')
+    generate.unittest_copyfiles_base = directory
+    generate.manifest_target = None
+    generate.ir_cache = None
+
+
+def generate_models(spec_dir, models):
+    """ Generates the models, without unit tests, of the spec in `spec_dir`
+    into `models` and puts them first on the path.
+    """
+    redirect_output(models)
+    generate.write_unittests = False
+    generate.parse(generate.SpecDirectory(spec_dir))
+    sys.path.insert(0, os.path.abspath(models))
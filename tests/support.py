@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  Shared setup for the tests: makes `generate` importable with the default
+#  settings, serves stand-in HTTP handlers, generates models to test and
+#  builds resources of them.
+#  Run from the repository root with `python -m unittest discover -s tests`
+
+import io
+import os
+import re
+import sys
+import atexit
+import shutil
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer
+from jinja2 import ChoiceLoader, DictLoader
+
+tests = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(tests)
+if root not in sys.path:
+    sys.path.insert(0, root)
+if 'settings' not in sys.modules:
+    import Python.settings
+    sys.modules['settings'] = Python.settings
+
+import generate
+import synthetic
+
+generate.loglevel = -1
+
+
+class StandIn(object):
+    """ Serves the given handler class on a free local port until stopped.
+    """
+    
+    def __init__(self, handler):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.httpd.daemon_threads = True
+        self.url = 'http://127.0.0.1:{}'.format(self.httpd.server_address[1])
+        self._thread = threading.Thread(target=self.httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._thread.join()
+
+
+class StoreServer(object):
+    """ A server with the blocking protocol serving the resources in `store`,
+    a dict by path like "Target/1". Answers reads, `_id` searches and
+    "batch" Bundles, raises for unknown paths like `FHIRServer` does for
+    404, and records the requests.
+    """
+    
+    base_uri = 'http://fhir.example/base'
+    
+    def __init__(self, store):
+        self.store = store
+        self.requests = []
+    
+    def request_json(self, path):
+        self.requests.append(path)
+        match = re.match(r'^(\w+)\?_id=([^&]+)&_count=\d+$', path)
+        if match is not None:
+            tp, ids = match.group(1), match.group(2).split(',')
+            return {
+                'resourceType': 'Bundle',
+                'entry': [{'resource': self.store['{}/{}'.format(tp, i)]} for i in ids if '{}/{}'.format(tp, i) in self.store],
+            }
+        jsondict = self.store.get(path.split('/_history/')[0])
+        if jsondict is None:
+            raise Exception("GET {} failed with status 404".format(path))
+        return jsondict
+    
+    def post_json(self, path, jsondict):
+        self.requests.append(('POST', path))
+        entries = []
+        for entry in jsondict['entry']:
+            resource = self.store.get(entry['request']['url'])
+            if resource is None:
+                entries.append({'response': {'status': '404 Not Found'}})
+            else:
+                entries.append({'resource': resource, 'response': {'status': '200 OK'}})
+        return {'resourceType': 'Bundle', 'type': 'batch-response', 'entry': entries}
+
+
+_models = None
+
+def generate_models(slots=False):
+    """ Generates models from a spec with three resources, "Target",
+    "Holder" referencing it with `subject` and `others`, and "Sample" with
+    properties of most kinds, once per process, and puts them first on the
+    path.
+    
+    :param bool slots: Whether the classes declare `__slots__`
+    :returns: The path of the models directory
+    """
+    global _models
+    if _models is not None:
+        if slots != generate.resource_slots:
+            raise Exception("Models have been generated {} slots already".format('with' if generate.resource_slots else 'without'))
+        return _models
+    
+    directory = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, directory, True)
+    spec_dir = os.path.join(directory, 'site')
+    synthetic.write_spec(spec_dir, num_profiles=0, examples=False)
+    synthetic.write_profile(spec_dir, 'Target', 'Resource', [
+        synthetic.element('Target.name', ['string']),
+    ], [])
+    synthetic.write_profile(spec_dir, 'Holder', 'Resource', [
+        synthetic.element('Holder.subject', ['ResourceReference'], '1', 'Target'),
+        synthetic.element('Holder.others', ['ResourceReference'], '*', 'Target'),
+    ], [])
+    synthetic.write_profile(spec_dir, 'Sample', 'Resource', [
+        synthetic.element('Sample.name', ['string']),
+        synthetic.element('Sample.status', ['code']),
+        synthetic.element('Sample.issued', ['dateTime']),
+        synthetic.element('Sample.birthDate', ['date']),
+        synthetic.element('Sample.coding', ['Coding'], '*'),
+        synthetic.element('Sample.concept', ['CodeableConcept']),
+        synthetic.element('Sample.period', ['Period']),
+        synthetic.element('Sample.part', None, '*'),
+        synthetic.element('Sample.part.code', ['code']),
+        synthetic.element('Sample.part.date', ['date']),
+        synthetic.element('Sample.subject', ['ResourceReference'], '1', 'Target'),
+    ], [])
+    
+    models = os.path.join(directory, 'models')
+    generate.resource_slots = slots
+    generate.jinjaenv.bytecode_cache.directory = os.path.join(directory, 'templates')
+    
+    # the search parameter template includes the class file by its mixed-case name
+    with io.open(os.path.join(root, 'Python', 'fhirsearchelement.py'), 'r', encoding='utf-8') as handle:
+        include = DictLoader({'Python/FHIRSearchElement.py': handle.read()})
+    generate.jinjaenv.loader = ChoiceLoader([generate.jinjaenv.loader, include])
+    synthetic.generate_models(spec_dir, models)
+    _models = models
+    return models
+
+
+def target_store(count):
+    """ A `StoreServer` store with the Targets "Target/0" to
+    "Target/{count - 1}", named "Target 0" and so on.
+    """
+    return {'Target/{}'.format(i): {'resourceType': 'Target', 'id': str(i), 'name': 'Target {}'.format(i)} for i in range(count)}
+
+
+def new_holder(server, subject, others=None):
+    """ A Holder of the generated models, as if read from `server`, with the
+    given references as `subject` and `others`.
+    """
+    import holder
+    res = holder.Holder({
+        'resourceType': 'Holder',
+        'subject': {'reference': subject},
+        'others': [{'reference': ref} for ref in others or []],
+    })
+    res._server = server
+    return res
+
+
+def sample_json(i=0):
+    """ The JSON of a Sample, with values depending on `i`; the dates of
+    its parts are partial.
+    """
+    return {
+        'resourceType': 'Sample',
+        'name': 'Sample {}'.format(i),
+        'status': 'final',
+        'issued': '2014-05-{:02d}T10:30:00Z'.format(i % 28 + 1),
+        'birthDate': '1970-01-{:02d}'.format(i % 28 + 1),
+        'coding': [
+            {'system': 'http://loinc.org', 'code': '8867-4', 'display': 'Heart rate'},
+            {'system': 'http://snomed.info/sct', 'code': str(i)},
+        ],
+        'concept': {'coding': [{'system': 'http://loinc.org', 'code': '8867-4'}], 'text': 'Heart rate'},
+        'period': {'start': '2014-05-01T10:30:00Z', 'end': '2014-05-02'},
+        'part': [{'code': 'a', 'date': '2014'}, {'code': 'b', 'date': '2014-05'}],
+        'subject': {'reference': 'Target/{}'.format(i)},
+    }
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  Tests for resuming and conditionally repeating the spec download
+
+import io
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import unittest
+from http.server import BaseHTTPRequestHandler
+
+import support
+import generate
+
+
+class SpecHandler(BaseHTTPRequestHandler):
+    """ Serves `payload` with a strong ETag, honoring Range, If-Range and
+    If-None-Match, and records the headers of every request.
+    """
+    protocol_version = 'HTTP/1.1'
+    payload = bytes(range(256)) * 64
+    etag = '"v1"'
+    received = []
+    
+    def do_GET(self):
+        self.received.append(dict(self.headers))
+        size = len(self.payload)
+        if self.etag == self.headers.get('If-None-Match'):
+            return self._respond(304, b'')
+        
+        byte_range = self.headers.get('Range')
+        if byte_range and self.headers.get('If-Range') in (None, self.etag):
+            start = int(byte_range[len('bytes='):-1])
+            if start >= size:
+                return self._respond(416, b'', {'Content-Range': 'bytes */{}'.format(size)})
+            return self._respond(206, self.payload[start:], {'Content-Range': 'bytes {}-{}/{}'.format(start, size - 1, size)})
+        self._respond(200, self.payload)
+    
+    def _respond(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, *args):
+        pass
+
+
+class DownloadTest(unittest.TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.standin = support.StandIn(SpecHandler)
+        cls.url = cls.standin.url + '/fhir-spec.zip'
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.standin.stop()
+    
+    def setUp(self):
+        SpecHandler.received = []
+        SpecHandler.etag = '"v1"'
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'fhir-spec.zip')
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def content(self, path):
+        with io.open(path, 'rb') as handle:
+            return handle.read()
+    
+    def meta(self):
+        with io.open(self.path + '.meta.json', 'r', encoding='utf-8') as handle:
+            return json.load(handle)
+    
+    def write_part(self, data):
+        with io.open(self.path + '.part', 'wb') as handle:
+            handle.write(data)
+        with io.open(self.path + '.meta.json', 'w', encoding='utf-8') as handle:
+            handle.write(json.dumps({'partial': {'etag': SpecHandler.etag, 'last_modified': None}}))
+    
+    def testDownload(self):
+        self.assertTrue(generate.download(self.url, self.path))
+        self.assertEqual(SpecHandler.payload, self.content(self.path))
+        self.assertFalse(os.path.exists(self.path + '.part'))
+        meta = self.meta()
+        self.assertEqual('"v1"', meta['etag'])
+        self.assertEqual(hashlib.sha256(SpecHandler.payload).hexdigest(), meta['sha256'])
+    
+    def testExistingIsNotRequested(self):
+        generate.download(self.url, self.path)
+        self.assertFalse(generate.download(self.url, self.path))
+        self.assertEqual(1, len(SpecHandler.received))
+    
+    def testResume(self):
+        self.write_part(SpecHandler.payload[:1000])
+        self.assertTrue(generate.download(self.url, self.path))
+        self.assertEqual(SpecHandler.payload, self.content(self.path))
+        self.assertEqual('bytes=1000-', SpecHandler.received[0]['Range'])
+        self.assertEqual('"v1"', SpecHandler.received[0]['If-Range'])
+        self.assertEqual(hashlib.sha256(SpecHandler.payload).hexdigest(), self.meta()['sha256'])
+    
+    def testResumeChanged(self):
+        self.write_part(SpecHandler.payload[:1000])
+        SpecHandler.etag = '"v2"'
+        self.assertTrue(generate.download(self.url, self.path))
+        self.assertEqual(SpecHandler.payload, self.content(self.path))
+        self.assertEqual('"v2"', self.meta()['etag'])
+    
+    def testCompletePart(self):
+        self.write_part(SpecHandler.payload)
+        checksum = hashlib.sha256(SpecHandler.payload).hexdigest()
+        self.assertTrue(generate.download(self.url, self.path, checksum=checksum))
+        self.assertEqual(SpecHandler.payload, self.content(self.path))
+        self.assertEqual(1, len(SpecHandler.received))
+        self.assertEqual('"v1"', self.meta()['etag'])
+    
+    def testOverlongPart(self):
+        self.write_part(SpecHandler.payload + b'garbage')
+        self.assertTrue(generate.download(self.url, self.path))
+        self.assertEqual(SpecHandler.payload, self.content(self.path))
+        self.assertEqual(2, len(SpecHandler.received))
+        self.assertNotIn('Range', SpecHandler.received[1])
+    
+    def testForceNotModified(self):
+        generate.download(self.url, self.path)
+        self.assertFalse(generate.download(self.url, self.path, force=True))
+        self.assertEqual('"v1"', SpecHandler.received[1]['If-None-Match'])
+    
+    def testForceModified(self):
+        generate.download(self.url, self.path)
+        SpecHandler.etag = '"v2"'
+        self.assertTrue(generate.download(self.url, self.path, force=True))
+        self.assertEqual('"v2"', self.meta()['etag'])
+    
+    def testChecksumMismatch(self):
+        with self.assertRaises(Exception):
+            generate.download(self.url, self.path, checksum='0' * 64)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(self.path + '.part'))
+
+
+if '__main__' == __name__:
+    unittest.main()
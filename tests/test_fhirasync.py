@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  Tests for using servers and models from asyncio code
+
+import time
+import asyncio
+import threading
+import unittest
+
+import support
+
+support.generate_models()
+
+import target
+import fhirasync
+
+
+class SlowServer(support.StoreServer):
+    """ Takes a while to answer and records the most requests at once.
+    """
+    
+    def __init__(self, store):
+        super(SlowServer, self).__init__(store)
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+    
+    def request_json(self, path):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(0.01)
+            return super(SlowServer, self).request_json(path)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class FHIRAsyncTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.server = SlowServer(support.target_store(10))
+        self.async_server = fhirasync.AsyncServer(self.server, concurrency=3)
+    
+    def tearDown(self):
+        self.async_server.close()
+    
+    def holder(self, subject, others=None):
+        return support.new_holder(self.async_server, subject, others)
+    
+    def testRead(self):
+        async def read():
+            return await asyncio.gather(*[fhirasync.read_async(target.Target, str(i), self.async_server) for i in range(10)])
+        instances = asyncio.run(read())
+        self.assertEqual(['Target {}'.format(i) for i in range(10)], [inst.name for inst in instances])
+        self.assertEqual('4', instances[4]._remote_id)
+        self.assertIs(self.async_server, instances[4]._server)
+        self.assertLessEqual(self.server.peak, 3)
+    
+    def testSemaphorePerLoop(self):
+        async def read():
+            return await asyncio.gather(*[fhirasync.read_async(target.Target, str(i), self.async_server) for i in range(6)])
+        self.assertEqual(6, len(asyncio.run(read())))
+        self.assertEqual(6, len(asyncio.run(read())))
+    
+    def testPerform(self):
+        self.server.store['Target?name=Target+1'] = {'resourceType': 'Bundle', 'entry': [{'content': self.server.store['Target/1']}]}
+        found = asyncio.run(fhirasync.perform_async(target.Target.where({'name': 'Target 1'}), self.async_server))
+        self.assertEqual(['Target 1'], [inst.name for inst in found])
+    
+    def testResolve(self):
+        res = self.holder('Target/1', ['Target/404'])
+        instance = asyncio.run(fhirasync.resolve_async(res.subject))
+        self.assertEqual('Target 1', instance.name)
+        self.assertIs(instance, res.subject.resolved)
+        with self.assertLogs(level='WARNING'):
+            self.assertIsNone(asyncio.run(fhirasync.resolve_async(res.others[0])))
+    
+    def testResolveAll(self):
+        resources = [self.holder('Target/{}'.format(i), ['Target/{}'.format(9 - i)]) for i in range(10)]
+        resolved = asyncio.run(fhirasync.resolve_all_async(resources, self.async_server, batch_size=2))
+        self.assertEqual(10, len(resolved))
+        self.assertEqual(5, len(self.server.requests))
+        self.assertEqual('Target 7', resources[2].others[0].resolved.name)
+    
+    def testResolveAllBatch(self):
+        resources = [self.holder('Target/{}'.format(i)) for i in range(4)]
+        asyncio.run(fhirasync.resolve_all_async(resources, self.async_server, batch_size=2, batch=True))
+        self.assertEqual([('POST', ''), ('POST', '')], self.server.requests)
+        self.assertEqual('Target 3', resources[3].subject.resolved.name)
+    
+    def testResolveAllFailedRequest(self):
+        resources = [self.holder('Target/1'), self.holder('Target/404/_history/3')]
+        with self.assertLogs(level='WARNING'):
+            resolved = asyncio.run(fhirasync.resolve_all_async(resources, self.async_server))
+        self.assertIsNone(resolved['Target/404/_history/3'])
+        self.assertEqual('Target 1', resources[0].subject.resolved.name)
+        self.assertIsNone(resources[1].subject.resolved)
+    
+    def testResolveAllBatchFailed(self):
+        self.server.post_json = lambda path, jsondict: 1 / 0
+        resources = [self.holder('Target/{}'.format(i)) for i in range(4)]
+        with self.assertLogs(level='WARNING'):
+            resolved = asyncio.run(fhirasync.resolve_all_async(resources, self.async_server, batch_size=2, batch=True))
+        self.assertEqual([None] * 4, list(resolved.values()))
+
+
+if '__main__' == __name__:
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  Tests for loading NDJSON bulk exports
+
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import support
+
+support.generate_models()
+
+import fhirbulk
+
+
+def sample_name(instance):
+    return instance.name
+
+
+class FHIRBulkTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+    
+    def write(self, name, lines, end='\n'):
+        path = os.path.join(self.directory, name)
+        with io.open(path, 'w', encoding='utf-8') as handle:
+            handle.write('\n'.join(lines) + end)
+        return path
+    
+    def samples(self, start, count):
+        lines = []
+        for i in range(start, start + count):
+            js = support.sample_json(i)
+            js['name'] = 'Sample {} {}'.format(i, 'ü' * (i % 7))
+            lines.append(json.dumps(js, ensure_ascii=False))
+        return lines
+    
+    def testBatchRanges(self):
+        path = self.write('samples.ndjson', self.samples(0, 20))
+        with open(path, 'rb') as handle:
+            data = handle.read()
+        for batch_size in (1, 100, 1000, len(data), 10 * len(data)):
+            ranges = fhirbulk.batch_ranges(path, batch_size)
+            self.assertEqual(0, ranges[0][0])
+            self.assertEqual(len(data), ranges[-1][1])
+            for (start, end), (next_start, next_end) in zip(ranges, ranges[1:]):
+                self.assertEqual(end, next_start)
+                self.assertEqual(b'\n', data[end - 1:end])
+    
+    def testLoad(self):
+        first = self.write('first.ndjson', self.samples(0, 15))
+        second = self.write('second.ndjson', [''] + self.samples(15, 10), end='')
+        expected = ['Sample {} {}'.format(i, 'ü' * (i % 7)) for i in range(25)]
+        for batch_size in (1, 300, 100000):
+            instances = list(fhirbulk.load([first, second], jobs=1, batch_size=batch_size))
+            self.assertEqual(expected, [inst.name for inst in instances])
+            self.assertEqual('Sample', instances[0].resource_name)
+    
+    def testLoadParallel(self):
+        path = self.write('samples.ndjson', self.samples(0, 40))
+        expected = ['Sample {} {}'.format(i, 'ü' * (i % 7)) for i in range(40)]
+        self.assertEqual(expected, [inst.name for inst in fhirbulk.load(path, jobs=2, batch_size=500)])
+        self.assertEqual(expected, list(fhirbulk.load(path, jobs=2, batch_size=500, func=sample_name)))
+    
+    def testErrors(self):
+        lines = self.samples(0, 3)
+        lines.insert(1, '{"resourceType": "Sample", "name": ')
+        lines.insert(3, '{"resourceType": "Unknown"}')
+        path = self.write('errors.ndjson', lines)
+        with self.assertRaises(Exception):
+            list(fhirbulk.load(path, jobs=1))
+        
+        errors = []
+        names = [inst.name for inst in fhirbulk.load(path, jobs=1, batch_size=100, errors=errors)]
+        self.assertEqual(3, len(names))
+        offset = len((lines[0] + '\n').encode('utf-8'))
+        self.assertEqual((path, offset), errors[0][:2])
+        self.assertIn('Unknown', errors[1][2])
+
+
+if '__main__' == __name__:
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  Tests for reading Bundles incrementally
+
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import support
+
+support.generate_models()
+
+import sample
+import target
+import fhirbundle
+
+
+class ChunkedStream(object):
+    """ Returns at most `size` bytes per `read()`, like a slow network.
+    """
+    
+    def __init__(self, data, size):
+        self.stream = io.BytesIO(data)
+        self.size = size
+    
+    def read(self, size=-1):
+        return self.stream.read(self.size)
+
+
+def bundle_json(count):
+    return {
+        'resourceType': 'Bundle',
+        'title': 'Größen',
+        'entry': [{'content': support.sample_json(i)} for i in range(count)] + [
+            {'content': {'resourceType': 'Target', 'name': 'Zielgröße'}},
+            {'content': {'resourceType': 'Unknown'}},
+            {'deleted': True},
+        ],
+        'totalResults': count + 3,
+    }
+
+
+class BundleReaderTest(unittest.TestCase):
+    
+    def testChunked(self):
+        js = bundle_json(5)
+        data = json.dumps(js, indent=1, ensure_ascii=False).encode('utf-8')
+        for size in (1, 3, 7, 1000):
+            reader = fhirbundle.BundleReader(ChunkedStream(data, size), chunk_size=size)
+            self.assertEqual(js['entry'], list(reader))
+            self.assertEqual({'resourceType': 'Bundle', 'title': 'Größen', 'totalResults': 8}, reader.bundle)
+    
+    def testText(self):
+        reader = fhirbundle.BundleReader(io.StringIO(' { "entry" : [ ] , "total" : 12 } '), chunk_size=2)
+        self.assertEqual([], list(reader))
+        self.assertEqual({'total': 12}, reader.bundle)
+        self.assertEqual([], list(fhirbundle.BundleReader(io.BytesIO(b'{}'))))
+    
+    def testResources(self):
+        data = json.dumps(bundle_json(3)).encode('utf-8')
+        with self.assertLogs(level='WARNING'):
+            resources = list(fhirbundle.BundleReader(ChunkedStream(data, 5), chunk_size=5).resources())
+        self.assertEqual([sample.Sample] * 3 + [target.Target], [res.__class__ for res in resources])
+        self.assertEqual('Sample 2', resources[2].name)
+        self.assertEqual('Zielgröße', resources[3].name)
+    
+    def testReadFile(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'bundle.json')
+        with io.open(path, 'w', encoding='utf-8') as handle:
+            json.dump(bundle_json(2), handle)
+        with self.assertLogs(level='WARNING'):
+            self.assertEqual(3, len(list(fhirbundle.read_file(path))))
+    
+    def testMalformed(self):
+        malformed = [
+            b'',
+            b'[]',
+            b'{"entry": [{"content": {}}',
+            b'{"entry": [{"content": {}} {"content": {}}]}',
+            b'{"entry": [{"content": {"resourceType": "Sample", "name": "trunc',
+            b'{"title" "missing colon"}',
+            b'{12: "number as key"}',
+        ]
+        for data in malformed:
+            with self.assertRaises(ValueError):
+                list(fhirbundle.BundleReader(ChunkedStream(data, 4), chunk_size=4))
+    
+    def testMalformedAfterEntries(self):
+        data = b'{"entry": [{"content": {"resourceType": "Target", "name": "T"}}, oops]}'
+        reader = iter(fhirbundle.BundleReader(ChunkedStream(data, 8), chunk_size=8).resources())
+        self.assertEqual('T', next(reader).name)
+        with self.assertRaises(ValueError):
+            next(reader)
+
+
+if '__main__' == __name__:
+    unittest.main()
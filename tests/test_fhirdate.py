@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  Tests for FHIR dates in deferred mode
+
+import datetime
+import unittest
+
+import support
+
+support.generate_models()
+
+import sample
+import fhirdate
+
+
+class FHIRDateDeferredTest(unittest.TestCase):
+    
+    def setUp(self):
+        fhirdate.FHIRDate.deferred = True
+    
+    def tearDown(self):
+        fhirdate.FHIRDate.deferred = False
+    
+    def testAsJson(self):
+        js = support.sample_json()
+        js['issued'] = '2014-05-01T10:30:00.250+02:00'
+        inst = sample.Sample(js)
+        self.assertEqual(js, inst.as_json())
+        self.assertEqual('2014', inst.part[0].date.origval)
+    
+    def testParsedOnAccess(self):
+        date = fhirdate.FHIRDate('2014-05')
+        self.assertIsNone(date._date)
+        self.assertEqual(datetime.date(2014, 5, 1), date.date)
+        self.assertEqual('2014-05', date.isostring)
+    
+    def testSetDate(self):
+        inst = sample.Sample(support.sample_json())
+        inst.birthDate.date = datetime.date(1971, 2, 3)
+        self.assertIsNone(inst.birthDate.origval)
+        self.assertEqual('1971-02-03', inst.as_json()['birthDate'])
+    
+    def testEager(self):
+        fhirdate.FHIRDate.deferred = False
+        date = fhirdate.FHIRDate('2014-05')
+        self.assertIsNone(date.origval)
+        self.assertEqual('2014-05-01', date.as_json())
+
+
+if '__main__' == __name__:
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  Tests for instantiating generated models from JSON
+
+import os
+import sys
+import json
+import unittest
+import subprocess
+
+import support
+
+support.generate_models()
+
+import holder
+import sample
+import fhirelement
+
+
+class FHIRElementTest(unittest.TestCase):
+    
+    def testUnknownKeys(self):
+        js = support.sample_json()
+        js['unknown'] = 1
+        js['part'][0]['other'] = 'x'
+        inst = sample.Sample(js)
+        self.assertEqual(['unknown'], inst._unknown_keys)
+        self.assertEqual(['other'], inst.part[0]._unknown_keys)
+        self.assertIsNone(inst.part[1]._unknown_keys)
+        self.assertEqual('Sample 0', inst.name)
+        self.assertEqual('a', inst.part[0].code)
+    
+    def testUpdateWithJson(self):
+        inst = sample.Sample(support.sample_json())
+        inst.update_with_json({'name': 'Renamed', 'unknown': 1})
+        self.assertEqual('Renamed', inst.name)
+        self.assertEqual('final', inst.status)
+        self.assertEqual(['unknown'], inst._unknown_keys)
+        self.assertNotIn('unknown', inst.as_json())
+    
+    def testJsonParsers(self):
+        parsers = sample.Sample.json_parsers()
+        self.assertEqual(('name', None, None), parsers['name'])
+        self.assertEqual('subject', parsers['subject'][0])
+        self.assertIn('extension', parsers)
+        self.assertIs(parsers, sample.Sample.json_parsers())
+        self.assertEqual('birthDate', sample.Sample.json_keys()['birthDate'])
+    
+    
+    def testAsJson(self):
+        js = support.sample_json()
+        js['part'] = [{'code': 'a', 'date': '2014-05-01'}, {'code': 'b'}]
+        self.assertEqual(js, sample.Sample(js).as_json())
+        
+        js = {
+            'resourceType': 'Holder',
+            'extension': [{'url': 'http://fhir.example/extension'}],
+            'contained': [{'resourceType': 'Target', 'id': 't1', 'name': 'Contained'}],
+            'subject': {'reference': '#t1'},
+            'others': [{'reference': 'Target/1'}, {'reference': 'Target/2'}],
+        }
+        self.assertEqual(js, holder.Holder(js).as_json())
+    
+    def testAsJsonPartialDates(self):
+        first = sample.Sample(support.sample_json()).as_json()
+        self.assertEqual('2014-01-01', first['part'][0]['date'])
+        self.assertEqual(first, sample.Sample(first).as_json())
+    
+    def testLazy(self):
+        eager = sample.Sample(support.sample_json())
+        sample.Sample.lazy = True
+        try:
+            inst = sample.Sample(support.sample_json())
+        finally:
+            del sample.Sample.lazy
+        self.assertNotIn('coding', vars(inst))
+        self.assertEqual(eager.coding[1].code, inst.coding[1].code)
+        self.assertIn('coding', vars(inst))
+        self.assertIs(inst.coding, inst.coding)
+        self.assertIs(inst, inst.part[0]._owner)
+        self.assertEqual(eager.as_json(), inst.as_json())
+        with self.assertRaises(AttributeError):
+            inst.unknown
+    
+    def testLazyEverywhere(self):
+        eager = sample.Sample(support.sample_json())
+        fhirelement.FHIRElement.lazy = True
+        try:
+            inst = sample.Sample(support.sample_json())
+            inst.update_with_json({'name': 'Renamed'})
+            part = inst.part[0]
+        finally:
+            fhirelement.FHIRElement.lazy = False
+        self.assertNotIn('code', vars(part))
+        self.assertEqual('Renamed', inst.name)
+        self.assertEqual(dict(eager.as_json(), name='Renamed'), inst.as_json())
+    
+    def testSlots(self):
+        # the models of this process have no slots, check slotted ones in another
+        script = """if True:
+            import json
+            import support
+            support.generate_models(slots=True)
+            import sample
+            inst = sample.Sample(support.sample_json())
+            try:
+                inst.other = 1
+                assigned = True
+            except AttributeError:
+                assigned = False
+            print(json.dumps({
+                'dicts': [hasattr(elem, '__dict__') for elem in (inst, inst.part[0], inst.coding[0], inst.subject, inst.issued)],
+                'assigned': assigned,
+                'json': inst.as_json(),
+            }))
+        """
+        env = dict(os.environ, PYTHONPATH=support.tests)
+        output = subprocess.check_output([sys.executable, '-c', script], cwd=support.root, env=env, stderr=subprocess.DEVNULL)
+        result = json.loads(output.decode('utf-8'))
+        self.assertEqual([False] * 5, result['dicts'])
+        self.assertFalse(result['assigned'])
+        self.assertEqual(sample.Sample(support.sample_json()).as_json(), result['json'])
+
+
+if '__main__' == __name__:
+    unittest.main()
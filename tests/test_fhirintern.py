@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  Tests for interning strings and sharing codings
+
+import json
+import unittest
+
+import support
+
+support.generate_models()
+
+import sample
+import fhirintern
+
+
+def parsed(i=0):
+    """ A Sample from freshly decoded JSON, so no strings are shared yet.
+    """
+    return sample.Sample(json.loads(json.dumps(support.sample_json(i))))
+
+
+class FHIRInternTest(unittest.TestCase):
+    
+    def setUp(self):
+        fhirintern.reset_report()
+    
+    def tearDown(self):
+        fhirintern.disable()
+        fhirintern.reset_report()
+    
+    def testDisabled(self):
+        first, second = parsed(), parsed()
+        self.assertEqual(first.status, second.status)
+        self.assertIsNot(first.status, second.status)
+        self.assertIsNot(first.coding[0], second.coding[0])
+        self.assertIsNone(fhirintern.string_class())
+    
+    def testStrings(self):
+        fhirintern.enable(flyweights=None)
+        first, second = parsed(), parsed(1)
+        self.assertIs(first.status, second.status)
+        self.assertIs(first.coding[0].system, second.coding[0].system)
+        self.assertIs(first.part[0].code, second.part[0].code)
+        self.assertIsNot(first.coding[0], second.coding[0])
+        self.assertIsNot(first.name, second.name)
+        self.assertGreater(fhirintern.report()['strings_deduplicated'], 0)
+    
+    def testFlyweights(self):
+        fhirintern.enable()
+        first, second = parsed(), parsed(1)
+        self.assertIs(first.coding[0], second.coding[0])
+        self.assertIsNot(first.coding[1], second.coding[1])
+        self.assertIs(first.concept, second.concept)
+        self.assertIs(second.coding[1], parsed(1).coding[1])
+        self.assertEqual(support.sample_json(1)['coding'], [coding.as_json() for coding in second.coding])
+        
+        report = fhirintern.report()
+        self.assertGreater(report['flyweight_hits'], 0)
+        self.assertGreater(report['bytes_saved'], 0)
+    
+    def testSameJson(self):
+        fhirintern.enable()
+        interned = parsed(2).as_json()
+        fhirintern.disable()
+        self.assertEqual(parsed(2).as_json(), interned)
+    
+    def testDisable(self):
+        fhirintern.enable()
+        parsed()
+        fhirintern.disable()
+        first, second = parsed(), parsed()
+        self.assertIsNot(first.status, second.status)
+        self.assertIsNot(first.coding[0], second.coding[0])
+        self.assertFalse(first.coding[0].__class__.flyweight)
+    
+    def testUnknownFlyweight(self):
+        with self.assertRaises(Exception):
+            fhirintern.enable(flyweights=['NoSuchClass'])
+
+
+if '__main__' == __name__:
+    unittest.main()
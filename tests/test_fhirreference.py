@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  Tests for resolving contained and remote references
+
+import unittest
+
+import support
+
+support.generate_models()
+
+import holder
+import fhirreference
+import fhirreferencecache
+
+
+class FHIRReferenceTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.server = support.StoreServer(support.target_store(10))
+    
+    def tearDown(self):
+        fhirreference.FHIRReference.fetch_remote = False
+        fhirreference.cache = None
+    
+    def holder(self, subject, others=None):
+        return support.new_holder(self.server, subject, others)
+    
+    def testContained(self):
+        res = holder.Holder({
+            'resourceType': 'Holder',
+            'contained': [{'resourceType': 'Target', 'id': 't1', 'name': 'Contained'}],
+            'subject': {'reference': '#t1'},
+            'others': [{'reference': '#t1'}],
+        })
+        self.assertEqual('Contained', res.subject.resolved.name)
+        self.assertIs(res.subject.resolved, res.others[0].resolved)
+    
+    def testRemotePath(self):
+        self.assertEqual('Target/1', fhirreference.remote_path('Target/1'))
+        self.assertEqual('Target/1/_history/2', fhirreference.remote_path('Target/1/_history/2'))
+        self.assertEqual('Target/1', fhirreference.remote_path('http://fhir.example/base/Target/1', self.server))
+        self.assertIsNone(fhirreference.remote_path('http://elsewhere.example/Target/1', self.server))
+        self.assertIsNone(fhirreference.remote_path('#t1'))
+    
+    def testNotFetchedByDefault(self):
+        res = self.holder('Target/1')
+        self.assertIsNone(res.subject.resolved)
+        self.assertEqual([], self.server.requests)
+    
+    def testFetchRemote(self):
+        fhirreference.FHIRReference.fetch_remote = True
+        res = self.holder('Target/1', ['http://fhir.example/base/Target/1'])
+        target = res.subject.resolved
+        self.assertEqual('Target 1', target.name)
+        self.assertIs(self.server, target._server)
+        self.assertEqual('1', target._remote_id)
+        self.assertIs(target, res.subject.resolved)
+        self.assertEqual(['Target/1'], self.server.requests)
+    
+    def testFetchRemoteNotFound(self):
+        fhirreference.FHIRReference.fetch_remote = True
+        res = self.holder('Target/404')
+        with self.assertLogs(level='WARNING'):
+            self.assertIsNone(res.subject.resolved)
+        self.assertEqual(['Target/404'], self.server.requests)
+    
+    def testResolveAll(self):
+        resources = [self.holder('Target/{}'.format(i % 5), ['Target/{}'.format(i), 'Target/404']) for i in range(8)]
+        with self.assertLogs(level='WARNING'):
+            resolved = fhirreference.resolve_all(resources, self.server, batch_size=4)
+        self.assertEqual(3, len(self.server.requests))
+        self.assertTrue(all(path.startswith('Target?_id=') for path in self.server.requests))
+        self.assertIsNone(resolved['Target/404'])
+        self.assertEqual(8, sum(1 for instance in resolved.values() if instance is not None))
+        
+        self.assertEqual('Target 3', resources[3].subject.resolved.name)
+        self.assertIs(resources[3].others[0].resolved, resources[3].subject.resolved)
+        self.assertIsNone(resources[3].others[1].resolved)
+        self.assertEqual(3, len(self.server.requests))
+    
+    def testResolveAllBatch(self):
+        resources = [self.holder('Target/{}'.format(i), ['Target/404']) for i in range(3)]
+        with self.assertLogs(level='WARNING'):
+            resolved = fhirreference.resolve_all(resources, self.server, batch=True)
+        self.assertEqual([('POST', '')], self.server.requests)
+        self.assertEqual('Target 2', resources[2].subject.resolved.name)
+        self.assertIsNone(resolved['Target/404'])
+    
+    def testResolveAllVersioned(self):
+        res = self.holder('Target/1/_history/2')
+        fhirreference.resolve_all([res], self.server)
+        self.assertEqual(['Target/1/_history/2'], self.server.requests)
+        self.assertEqual('Target 1', res.subject.resolved.name)
+    
+    def testResolveAllFailedRequest(self):
+        resources = [self.holder('Target/1'), self.holder('Target/404/_history/3')]
+        with self.assertLogs(level='WARNING'):
+            resolved = fhirreference.resolve_all(resources, self.server)
+        self.assertIsNone(resolved['Target/404/_history/3'])
+        self.assertEqual('Target 1', resources[0].subject.resolved.name)
+        self.assertIsNone(resources[1].subject.resolved)
+    
+    def testCache(self):
+        fhirreference.cache = fhirreferencecache.ReferenceCache(max_size=2)
+        fhirreference.resolve_all([self.holder('Target/1')], self.server)
+        requests = len(self.server.requests)
+        
+        res = self.holder('http://fhir.example/base/Target/1')
+        self.assertEqual('Target 1', res.subject.resolved.name)
+        self.assertEqual(requests, len(self.server.requests))
+        fhirreference.resolve_all([self.holder('Target/2'), self.holder('Target/3')], self.server)
+        self.assertEqual(1, fhirreference.cache.stats()['evictions'])
+    
+    def testCacheWithoutServer(self):
+        fhirreference.cache = fhirreferencecache.ReferenceCache()
+        fhirreference.resolve_all([self.holder('Target/1')], self.server)
+        
+        res = holder.Holder({
+            'resourceType': 'Holder',
+            'subject': {'reference': 'http://fhir.example/base/Target/1'},
+            'others': [{'reference': 'http://fhir.example/base/Target/2'}, {'reference': 'Target/1'}],
+        })
+        self.assertEqual('Target 1', res.subject.resolved.name)
+        self.assertIsNone(res.others[0].resolved)
+        self.assertIsNone(res.others[1].resolved)
+
+
+if '__main__' == __name__:
+    unittest.main()
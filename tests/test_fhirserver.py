@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  Tests for the pooled FHIR server client
+
+import gzip
+import json
+import time
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler
+
+import support
+import fhirserver
+
+
+class FHIRHandler(BaseHTTPRequestHandler):
+    """ Answers GETs of "/base/Type/id" with a resource, gzipped if accepted,
+    404 for ids starting with "missing", 500 with a corrupt gzip body for
+    ids starting with "corrupt" and with a truncated one for ids starting
+    with "truncated", and echoes POSTed JSON. Records the
+    requests, the client connections and the most requests at once.
+    """
+    protocol_version = 'HTTP/1.1'
+    delay = 0
+    drop_connections = False
+    received = []
+    connections = set()
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+    
+    def do_GET(self):
+        self._begin(None)
+        try:
+            time.sleep(self.delay)
+            path = self.path[len('/base/'):]
+            if path.split('/')[-1].startswith('missing'):
+                self._respond(404, {'resourceType': 'OperationOutcome'})
+            elif path.split('/')[-1].startswith(('corrupt', 'truncated')):
+                self.send_response(500)
+                self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', '7' if path.split('/')[-1].startswith('corrupt') else '100')
+                self.end_headers()
+                self.wfile.write(b'corrupt')
+                self.close_connection = True
+            else:
+                self._respond(200, {'resourceType': path.split('/')[0], 'id': path.split('/')[-1], 'text': 'x' * 2000})
+        finally:
+            self._end()
+    
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self._begin(body)
+        try:
+            if 'gzip' == self.headers.get('Content-Encoding'):
+                body = gzip.decompress(body)
+            self._respond(200, json.loads(body.decode('utf-8')))
+        finally:
+            self._end()
+    
+    def _begin(self, body):
+        cls = self.__class__
+        with cls.lock:
+            cls.received.append((self.command, self.path, dict(self.headers), body))
+            cls.connections.add(self.client_address)
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+    
+    def _end(self):
+        cls = self.__class__
+        with cls.lock:
+            cls.active -= 1
+        if self.drop_connections:
+            self.close_connection = True
+    
+    def _respond(self, status, jsondict):
+        data = json.dumps(jsondict).encode('utf-8')
+        self.send_response(status)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            data = gzip.compress(data)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Type', 'application/json+fhir')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, *args):
+        pass
+
+
+class FHIRServerTest(unittest.TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.standin = support.StandIn(FHIRHandler)
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.standin.stop()
+    
+    def setUp(self):
+        FHIRHandler.delay = 0
+        FHIRHandler.drop_connections = False
+        FHIRHandler.received = []
+        FHIRHandler.connections = set()
+        FHIRHandler.peak = 0
+        self.server = fhirserver.FHIRServer(self.standin.url + '/base/', max_connections=4)
+    
+    def tearDown(self):
+        self.server.close()
+    
+    def testBaseURI(self):
+        self.assertEqual(self.standin.url + '/base', self.server.base_uri)
+        with self.assertRaises(Exception):
+            fhirserver.FHIRServer('ftp://fhir.example/base')
+    
+    def testRequestJson(self):
+        js = self.server.request_json('Patient/23')
+        self.assertEqual('Patient', js['resourceType'])
+        self.assertEqual('23', js['id'])
+        method, path, headers, body = FHIRHandler.received[0]
+        self.assertEqual('/base/Patient/23', path)
+        self.assertEqual('gzip', headers['Accept-Encoding'])
+        self.assertEqual('application/json+fhir', headers['Accept'])
+    
+    def testNotFound(self):
+        with self.assertRaises(Exception) as context:
+            self.server.request_json('Patient/missing')
+        self.assertIn('404', str(context.exception))
+        self.assertEqual('23', self.server.request_json('Patient/23')['id'])
+    
+    def testGzipRequestBody(self):
+        small = {'resourceType': 'Bundle', 'entry': []}
+        large = {'resourceType': 'Bundle', 'entry': [{'request': {'method': 'GET', 'url': 'Patient/{}'.format(i)}} for i in range(100)]}
+        self.assertEqual(small, self.server.post_json('', small))
+        self.assertEqual(large, self.server.post_json('', large))
+        self.assertNotIn('Content-Encoding', FHIRHandler.received[0][2])
+        self.assertEqual('gzip', FHIRHandler.received[1][2]['Content-Encoding'])
+        self.assertLess(len(FHIRHandler.received[1][3]), len(json.dumps(large)))
+    
+    def testPooling(self):
+        for i in range(20):
+            self.server.request_json('Patient/{}'.format(i))
+        self.assertEqual(1, len(FHIRHandler.connections))
+        self.assertEqual(1, self.server._idle.qsize())
+    
+    def testDroppedConnection(self):
+        FHIRHandler.drop_connections = True
+        for i in range(3):
+            self.assertEqual(str(i), self.server.request_json('Patient/{}'.format(i))['id'])
+        self.assertEqual(3, len(FHIRHandler.connections))
+    
+    def testDroppedConnectionPost(self):
+        FHIRHandler.drop_connections = True
+        self.server.request_json('Patient/1')
+        with self.assertRaises(Exception):
+            self.server.post_json('', {'resourceType': 'Bundle'})
+        self.assertEqual(['GET'], [received[0] for received in FHIRHandler.received])
+        self.assertEqual('2', self.server.request_json('Patient/2')['id'])
+    
+    def testCorruptErrorResponse(self):
+        for i in range(3):
+            for prefix in ('corrupt', 'truncated'):
+                with self.assertRaises(Exception):
+                    self.server.request_json('Patient/{}{}'.format(prefix, i))
+        self.assertTrue(all(self.server._slots.acquire(False) for i in range(4)))
+    
+    def testRequestJsonMany(self):
+        FHIRHandler.delay = 0.05
+        paths = ['Patient/{}'.format(i) for i in range(12)]
+        results = self.server.request_json_many(paths)
+        self.assertEqual([str(i) for i in range(12)], [js['id'] for js in results])
+        self.assertGreater(FHIRHandler.peak, 1)
+        self.assertLessEqual(FHIRHandler.peak, 4)
+        self.assertLessEqual(len(FHIRHandler.connections), 4)
+    
+    def testRequestJsonManyFails(self):
+        with self.assertRaises(Exception):
+            self.server.request_json_many(['Patient/1', 'Patient/missing', 'Patient/2'])
+        self.assertEqual(3, len(self.server.request_json_many(['Patient/1', 'Patient/2', 'Patient/3'])))
+    
+    def testRequestStream(self):
+        stream = self.server.request_stream('Patient/23')
+        data = b''
+        for chunk in iter(lambda: stream.read(100), b''):
+            data += chunk
+        stream.close()
+        self.assertEqual('23', json.loads(data.decode('utf-8'))['id'])
+        self.assertEqual(1, self.server._idle.qsize())
+
+
+if '__main__' == __name__:
+    unittest.main()